@@ -250,6 +250,9 @@ class CircleAcquisition:
                 self.num_positions, self.num_circles, self.circle_radius, self.z_offset
             )
             
+            # Indexer cette acquisition comme la plus récente (lue par la synchronisation)
+            self.storage.record_latest_acquisition()
+            
             print(f"\nMétadonnées générées:")
             print(f"- images.json: {os.path.join(self.session_dirs['metadata'], 'images.json')}")
             print(f"- files.json: {os.path.join(self.session_dirs['main'], 'files.json')}")
@@ -11,6 +11,9 @@ import time
 from datetime import datetime
 from core.utils import config
 
+# Index de la dernière acquisition, dans le répertoire parent des acquisitions
+LATEST_INDEX_FILE = ".latest.json"
+
 class StorageManager:
     def __init__(self, parent_dir=None, mode="acquisition"):
         """Initialise le gestionnaire de stockage"""
@@ -39,9 +42,6 @@ class StorageManager:
         Returns:
             Dictionnaire des chemins créés
         """
-        # Créer le répertoire parent s'il n'existe pas
-        os.makedirs(self.parent_dir, exist_ok=True)
-        
         # Générer le timestamp pour le nom du répertoire
         timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
         
@@ -64,10 +64,8 @@ class StorageManager:
             metadata_dir = os.path.join(main_dir, "metadata")
             metadata_images_dir = os.path.join(metadata_dir, "images")
             
-            # Créer les répertoires
-            os.makedirs(main_dir, exist_ok=True)
+            # Créer les répertoires (makedirs crée les parents: seules les feuilles)
             os.makedirs(images_dir, exist_ok=True)
-            os.makedirs(metadata_dir, exist_ok=True)
             os.makedirs(metadata_images_dir, exist_ok=True)
             
             # Stocker les chemins
@@ -87,8 +85,7 @@ class StorageManager:
             analysis_dir = os.path.join(main_dir, "analysis")
             visualization_dir = os.path.join(main_dir, "visualizations")
             
-            # Créer les répertoires
-            os.makedirs(main_dir, exist_ok=True)
+            # Créer les répertoires (makedirs crée les parents: seules les feuilles)
             os.makedirs(images_dir, exist_ok=True)
             os.makedirs(analysis_dir, exist_ok=True)
             os.makedirs(visualization_dir, exist_ok=True)
@@ -106,6 +103,34 @@ class StorageManager:
         
         return self.dirs
     
+    def record_latest_acquisition(self):
+        """
+        Enregistre l'acquisition courante comme la plus récente dans
+        <parent_dir>/.latest.json (lu par la synchronisation au lieu de lister
+        tout le répertoire des acquisitions)
+        
+        Returns:
+            Chemin du fichier d'index, ou None en cas d'erreur
+        """
+        if self.dirs is None:
+            raise RuntimeError("Structure de répertoires non initialisée")
+        
+        try:
+            dir_name = os.path.basename(self.dirs["main"])
+            index_path = os.path.join(self.parent_dir, LATEST_INDEX_FILE)
+            
+            # Écriture atomique: un lecteur ne voit jamais un fichier à moitié écrit
+            tmp_path = f"{index_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({"name": dir_name}, f)
+            os.replace(tmp_path, index_path)
+            
+            return index_path
+        
+        except Exception as e:
+            print(f"Erreur lors de l'enregistrement de la dernière acquisition: {e}")
+            return None
+    
     def save_json(self, data, filename, subdirectory=None):
         """Sauvegarde des données au format JSON"""
         if self.dirs is None:
@@ -13,16 +13,17 @@ def normalize_angle_difference(delta):
     Normalise la différence d'angle pour prendre le chemin le plus court
     
     Args:
-        delta: Différence d'angle en degrés
+        delta: Différence d'angle en degrés (scalaire ou tableau numpy)
         
     Returns:
         Différence normalisée entre -180 et +180 degrés
     """
-    if delta > 180:
-        delta -= 360
-    elif delta < -180:
-        delta += 360
-    return delta
+    # Forme sans branchement: retirer le nombre entier de tours le plus proche
+    if np.ndim(delta) == 0:
+        return delta - 360.0 * round(delta / 360.0)
+    
+    deltas = np.asarray(delta, dtype=float)
+    return deltas - 360.0 * np.round(deltas / 360.0)
 
 def calculate_camera_angles(camera_position, target_position):
     """
@@ -37,8 +37,13 @@ class CameraController:
         os.makedirs(directory, exist_ok=True)
         print(f"Répertoire de sortie des photos: {directory}")
     
-    def take_photo(self, filename=None, metadata=None):
-        """Prend une photo avec la caméra"""
+    def capture(self):
+        """
+        Capture une image (exposition du capteur uniquement, sans écriture disque)
+        
+        Returns:
+            Image capturée, ou None en cas d'erreur
+        """
         if not self.initialized:
             raise RuntimeError("Caméra non initialisée")
         
@@ -46,30 +51,51 @@ class CameraController:
             print("Capture d'image en cours...")
             image = self.camera.grab()
             
-            if image is not None:
-                # Générer un nom de fichier s'il n'est pas spécifié
-                if filename is None:
-                    timestamp = time.strftime("%Y%m%d-%H%M%S")
-                    filename = f"photo_{timestamp}.jpg"
-                
-                # Ajouter le chemin complet
-                if self.photos_dir:
-                    filepath = os.path.join(self.photos_dir, filename)
-                else:
-                    filepath = filename
-                
-                # Sauvegarder l'image
-                image.save(filepath)
-                print(f"Image sauvegardée: {filepath}")
-                return filepath, metadata
-            else:
+            if image is None:
                 print("Erreur: Impossible de capturer l'image")
-                return None, None
-                
+            return image
+        
         except Exception as e:
             print(f"Erreur lors de la prise de photo: {e}")
+            return None
+    
+    def save_image(self, image, filename=None, metadata=None):
+        """
+        Sauvegarde une image capturée (peut s'exécuter dans un autre thread)
+        
+        Returns:
+            Tuple (chemin du fichier, métadonnées), ou (None, None) en cas d'erreur
+        """
+        try:
+            # Générer un nom de fichier s'il n'est pas spécifié
+            if filename is None:
+                timestamp = time.strftime("%Y%m%d-%H%M%S")
+                filename = f"photo_{timestamp}.jpg"
+            
+            # Ajouter le chemin complet
+            if self.photos_dir:
+                filepath = os.path.join(self.photos_dir, filename)
+            else:
+                filepath = filename
+            
+            # Sauvegarder l'image
+            image.save(filepath)
+            print(f"Image sauvegardée: {filepath}")
+            return filepath, metadata
+        
+        except Exception as e:
+            print(f"Erreur lors de la sauvegarde de l'image: {e}")
             return None, None
     
+    def take_photo(self, filename=None, metadata=None):
+        """Prend une photo avec la caméra"""
+        image = self.capture()
+        
+        if image is None:
+            return None, None
+        
+        return self.save_image(image, filename, metadata)
+    
     def shutdown(self):
         """Arrête proprement la caméra"""
         if not self.initialized:
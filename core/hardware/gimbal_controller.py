@@ -10,6 +10,7 @@ import math
 import serial
 import numpy as np
 from core.utils import config
+from core.geometry.angle_calculator import normalize_angle_difference
 
 class GimbalController:
     def __init__(self, arduino_port=None):
@@ -43,11 +44,7 @@ class GimbalController:
     
     def normalize_angle_difference(self, delta):
         """Normalise la différence d'angle pour prendre le chemin le plus court"""
-        if delta > 180:
-            delta -= 360
-        elif delta < -180:
-            delta += 360
-        return delta
+        return normalize_angle_difference(delta)
     
     def send_command(self, pan_angle, tilt_angle, wait_for_goal=False):
         """Envoie les angles à la gimbal"""
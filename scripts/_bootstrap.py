@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Ajoute le répertoire racine du projet au chemin de recherche Python (une seule fois)
+"""
+
+import os
+import sys
+
+# Répertoire racine du projet (parent de scripts/)
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
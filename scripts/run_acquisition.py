@@ -5,18 +5,16 @@
 Script pour exécuter l'acquisition d'images en cercle
 """
 
-import os
 import sys
 import argparse
 
 # Ajouter le répertoire parent au chemin de recherche Python
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import _bootstrap
 
-from acquisition.circle_acquisition import CircleAcquisition
 from core.utils import config
 
-def parse_arguments():
-    """Parse les arguments de la ligne de commande"""
+def _build_parser():
+    """Construit le parseur des arguments de la ligne de commande"""
     parser = argparse.ArgumentParser(description="Acquisition d'images en cercle")
     
     parser.add_argument("--circles", "-c", type=int, choices=[1, 2], default=1,
@@ -37,7 +35,14 @@ def parse_arguments():
     parser.add_argument("--speed", "-s", type=float, default=config.CNC_SPEED,
                       help=f"Vitesse de déplacement de la CNC en m/s (défaut: {config.CNC_SPEED})")
     
-    return parser.parse_args()
+    return parser
+
+# Parseur construit une seule fois, à l'import du script
+_PARSER = _build_parser()
+
+def parse_arguments():
+    """Parse les arguments de la ligne de commande"""
+    return _PARSER.parse_args()
 
 def main():
     """Fonction principale"""
@@ -46,6 +51,9 @@ def main():
     # Parser les arguments
     args = parse_arguments()
     
+    # Import différé: --help ne charge pas les modules matériels
+    from acquisition.circle_acquisition import CircleAcquisition
+    
     # Créer et exécuter l'acquisition
     acquisition = CircleAcquisition(args)
     success = acquisition.run_acquisition()
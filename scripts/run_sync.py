@@ -5,17 +5,15 @@
 Script pour exécuter la synchronisation serveur
 """
 
-import os
 import sys
 import argparse
+import logging
 
 # Ajouter le répertoire parent au chemin de recherche Python
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import _bootstrap
 
-from sync.server_sync import ServerSync
-
-def parse_arguments():
-    """Parse les arguments de la ligne de commande"""
+def _build_parser():
+    """Construit le parseur des arguments de la ligne de commande"""
     parser = argparse.ArgumentParser(description="Synchronisation Raspberry Pi - Serveur")
     
     parser.add_argument("--ssh-host", type=str,
@@ -39,7 +37,17 @@ def parse_arguments():
     parser.add_argument("--dry-run", action="store_true",
                       help="Mode simulation (pas d'exécution réelle)")
     
-    return parser.parse_args()
+    parser.add_argument("--compress", action="store_true",
+                      help="Compresser le transport SSH (liens lents)")
+    
+    return parser
+
+# Parseur construit une seule fois, à l'import du script
+_PARSER = _build_parser()
+
+def parse_arguments():
+    """Parse les arguments de la ligne de commande"""
+    return _PARSER.parse_args()
 
 def main():
     """Fonction principale"""
@@ -48,6 +56,16 @@ def main():
     # Parser les arguments
     args = parse_arguments()
     
+    # Configuration du logging (une seule fois pour tout le processus)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    
+    # Import différé: --help ne charge pas les modules de synchronisation
+    from sync.server_sync import ServerSync
+    
     # Créer et exécuter la synchronisation
     sync = ServerSync(args)
     success = sync.run_sync()
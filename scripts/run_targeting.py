@@ -5,12 +5,12 @@
 Script pour exécuter le ciblage de feuilles
 """
 
-import os
 import sys
 import argparse
+import logging
 
 # Ajouter le répertoire parent au chemin de recherche Python
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import _bootstrap
 
 # Importer la classe LeafTargeting refactorisée
 from targeting.leaf_targeting import LeafTargeting, parse_arguments
@@ -22,6 +22,13 @@ def main():
     # Parser les arguments
     args = parse_arguments()
     
+    # Configuration du logging (une seule fois pour tout le processus)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    
     # Créer et exécuter le ciblage
     targeting = LeafTargeting(args)
     success = targeting.run_targeting()
@@ -10,17 +10,37 @@ import sys
 import argparse
 import time
 import logging
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 
 # Ajouter le répertoire parent au chemin de recherche Python
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import _bootstrap
 
-# Importer les modules nécessaires
-from acquisition.circle_acquisition import CircleAcquisition
-from sync.server_sync import ServerSync
-from targeting.leaf_targeting import LeafTargeting
+# Les modules des étapes sont importés dans chaque étape (--help reste instantané)
 from core.utils import config
 
+# Logger du workflow (logging configuré une seule fois dans main)
+logger = logging.getLogger("workflow")
+
+@dataclass(frozen=True)
+class TargetingArgs:
+    """Paramètres transmis à l'étape de ciblage (sans __dict__ par instance)"""
+    # __slots__ explicites plutôt que slots=True, réservé à Python >= 3.10
+    __slots__ = ('point_cloud', 'scale', 'alpha', 'crop_method', 'crop_percentage', 'z_offset',
+                 'arduino_port', 'simulate', 'auto_photo', 'louvain_coeff', 'leiden', 'distance')
+    point_cloud: str
+    scale: float
+    alpha: float
+    crop_method: str
+    crop_percentage: float
+    z_offset: float
+    arduino_port: str
+    simulate: bool
+    auto_photo: bool
+    louvain_coeff: float
+    leiden: bool
+    distance: float
+
 class WorkflowManager:
     def __init__(self, args):
         """
@@ -29,13 +49,7 @@ class WorkflowManager:
         Args:
             args: Arguments de la ligne de commande
         """
-        # Configuration du logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[logging.StreamHandler(sys.stdout)]
-        )
-        self.logger = logging.getLogger("workflow")
+        self.logger = logger
         
         # Stockage des arguments
         self.args = args
@@ -49,6 +63,13 @@ class WorkflowManager:
         self.latest_acquisition_dir = None
         self.latest_ply_path = None
         
+        # Synchronisation préparée pendant l'acquisition (Clean lancé en avance)
+        self.server_sync = None
+        self.clean_future = None
+        
+        # Durée de chaque étape (secondes)
+        self.step_times = {}
+        
         # États pour le suivi du workflow
         self.acquisition_completed = False
         self.sync_completed = False
@@ -64,27 +85,22 @@ class WorkflowManager:
             self.acquisition_completed = True
             return True
         
-        try:
-            # Créer et initialiser l'acquisition
-            acquisition = CircleAcquisition(self.args)
-            
-            # Exécuter l'acquisition
-            self.logger.info("Démarrage de l'acquisition d'images...")
-            self.acquisition_result = acquisition.run_acquisition()
-            
-            if not self.acquisition_result:
-                self.logger.error("L'acquisition a échoué")
-                return False
-            
-            self.logger.info("Acquisition d'images terminée avec succès")
-            self.acquisition_completed = True
-            return True
-            
-        except Exception as e:
-            self.logger.error(f"Erreur pendant l'acquisition: {e}")
-            import traceback
-            traceback.print_exc()
+        from acquisition.circle_acquisition import CircleAcquisition
+        
+        # Créer et initialiser l'acquisition
+        acquisition = CircleAcquisition(self.args)
+        
+        # Exécuter l'acquisition
+        self.logger.info("Démarrage de l'acquisition d'images...")
+        self.acquisition_result = acquisition.run_acquisition()
+        
+        if not self.acquisition_result:
+            self.logger.error("L'acquisition a échoué")
             return False
+        
+        self.logger.info("Acquisition d'images terminée avec succès")
+        self.acquisition_completed = True
+        return True
     
     def run_sync(self):
         """Exécute l'étape de synchronisation avec le serveur"""
@@ -97,41 +113,44 @@ class WorkflowManager:
             # Si on saute la synchro, on doit quand même définir le chemin du PLY
             if self.args.point_cloud:
                 self.latest_ply_path = self.args.point_cloud
-                self.logger.info(f"Utilisation du nuage de points spécifié: {self.latest_ply_path}")
+                self.logger.info("Utilisation du nuage de points spécifié: %s", self.latest_ply_path)
                 self.sync_completed = True
                 return True
             else:
                 self.logger.error("Aucun nuage de points spécifié avec --point-cloud alors que --skip-sync est activé")
                 return False
         
-        try:
-            # Créer et initialiser la synchronisation
-            sync = ServerSync(self.args)
-            
-            # Exécuter la synchronisation
-            self.logger.info("Démarrage de la synchronisation...")
-            self.sync_result = sync.run_sync()
-            
-            if not self.sync_result:
-                self.logger.error("La synchronisation a échoué")
-                return False
-            
-            # Obtenir le chemin du dernier PLY
-            self.latest_ply_path = self._find_latest_ply()
-            
-            if not self.latest_ply_path:
-                self.logger.error("Impossible de trouver le nuage de points généré")
+        from sync.server_sync import ServerSync
+        
+        # Réutiliser la synchronisation dont le Clean a tourné pendant l'acquisition
+        # (run_sync ne relance pas un Clean réussi)
+        sync = self.server_sync or ServerSync(self.args)
+        if self.clean_future is not None:
+            self.logger.info("Attente de la fin du Clean lancé pendant l'acquisition...")
+            if not self.clean_future.result():
+                # Échec (verrou apparu, erreur ROMI): arrêter plutôt que de relancer Clean
+                # en silence sur un serveur dans un état inconnu
+                self.logger.error("Le Clean lancé pendant l'acquisition a échoué")
                 return False
-            
-            self.logger.info(f"Nuage de points trouvé: {self.latest_ply_path}")
-            self.sync_completed = True
-            return True
-            
-        except Exception as e:
-            self.logger.error(f"Erreur pendant la synchronisation: {e}")
-            import traceback
-            traceback.print_exc()
+        
+        # Exécuter la synchronisation
+        self.logger.info("Démarrage de la synchronisation...")
+        self.sync_result = sync.run_sync()
+        
+        if not self.sync_result:
+            self.logger.error("La synchronisation a échoué")
             return False
+        
+        # Obtenir le chemin du dernier PLY
+        self.latest_ply_path = self._find_latest_ply()
+        
+        if not self.latest_ply_path:
+            self.logger.error("Impossible de trouver le nuage de points généré")
+            return False
+        
+        self.logger.info("Nuage de points trouvé: %s", self.latest_ply_path)
+        self.sync_completed = True
+        return True
     
     def run_targeting(self):
         """Exécute l'étape de ciblage des feuilles"""
@@ -147,89 +166,118 @@ class WorkflowManager:
         if not self.latest_ply_path:
             if self.args.point_cloud:
                 self.latest_ply_path = self.args.point_cloud
-                self.logger.info(f"Utilisation du nuage de points spécifié: {self.latest_ply_path}")
+                self.logger.info("Utilisation du nuage de points spécifié: %s", self.latest_ply_path)
             else:
                 self.logger.error("Aucun nuage de points disponible pour le ciblage")
                 return False
         
-        try:
-            # Créer un dictionnaire d'arguments pour le targeting
-            targeting_args = argparse.Namespace(
-                point_cloud=self.latest_ply_path,
-                scale=self.args.scale,
-                alpha=self.args.alpha,
-                crop_method=self.args.crop_method,
-                crop_percentage=self.args.crop_percentage,
-                z_offset=self.args.z_offset,
-                arduino_port=self.args.arduino_port,
-                simulate=self.args.simulate,
-                auto_photo=self.args.auto_photo,
-                louvain_coeff=self.args.louvain_coeff,
-                distance=self.args.distance
-            )
-            
-            # Créer et initialiser le ciblage
-            targeting = LeafTargeting(targeting_args)
-            
-            # Exécuter le ciblage
-            self.logger.info("Démarrage du ciblage des feuilles...")
-            self.targeting_result = targeting.run_targeting()
-            
-            if not self.targeting_result:
-                self.logger.error("Le ciblage a échoué")
-                return False
-            
-            self.logger.info("Ciblage des feuilles terminé avec succès")
-            self.targeting_completed = True
-            return True
-            
-        except Exception as e:
-            self.logger.error(f"Erreur pendant le ciblage: {e}")
-            import traceback
-            traceback.print_exc()
+        from targeting.leaf_targeting import LeafTargeting
+        
+        # Créer les arguments pour le targeting
+        targeting_args = TargetingArgs(
+            point_cloud=self.latest_ply_path,
+            scale=self.args.scale,
+            alpha=self.args.alpha,
+            crop_method=self.args.crop_method,
+            crop_percentage=self.args.crop_percentage,
+            z_offset=self.args.z_offset,
+            arduino_port=self.args.arduino_port,
+            simulate=self.args.simulate,
+            auto_photo=self.args.auto_photo,
+            louvain_coeff=self.args.louvain_coeff,
+            leiden=self.args.leiden,
+            distance=self.args.distance
+        )
+        
+        # Créer et initialiser le ciblage
+        targeting = LeafTargeting(targeting_args)
+        
+        # Exécuter le ciblage
+        self.logger.info("Démarrage du ciblage des feuilles...")
+        self.targeting_result = targeting.run_targeting()
+        
+        if not self.targeting_result:
+            self.logger.error("Le ciblage a échoué")
             return False
+        
+        self.logger.info("Ciblage des feuilles terminé avec succès")
+        self.targeting_completed = True
+        return True
     
     def _find_latest_ply(self):
         """Trouve le dernier fichier PLY dans le répertoire des nuages de points"""
         ply_dir = config.LOCAL_PLY_TARGET
         
-        if not os.path.exists(ply_dir):
-            self.logger.error(f"Répertoire de nuages de points introuvable: {ply_dir}")
-            return None
-        
-        # Trouver tous les fichiers PLY
-        ply_files = [f for f in os.listdir(ply_dir) if f.lower().endswith('.ply')]
-        
-        if not ply_files:
-            self.logger.error(f"Aucun fichier PLY trouvé dans {ply_dir}")
+        # Un seul parcours: le stat des DirEntry est réutilisé, pas de liste ni de tri
+        latest_ply = None
+        latest_mtime = -1
+        try:
+            with os.scandir(ply_dir) as entries:
+                for entry in entries:
+                    if entry.name.lower().endswith('.ply') and entry.is_file(follow_symlinks=False):
+                        mtime = entry.stat().st_mtime
+                        if mtime > latest_mtime:
+                            latest_mtime = mtime
+                            latest_ply = entry.path
+        except FileNotFoundError:
+            self.logger.error("Répertoire de nuages de points introuvable: %s", ply_dir)
             return None
         
-        # Trier par date de modification (le plus récent en premier)
-        ply_files.sort(key=lambda f: os.path.getmtime(os.path.join(ply_dir, f)), reverse=True)
+        if latest_ply is None:
+            self.logger.error("Aucun fichier PLY trouvé dans %s", ply_dir)
         
-        # Retourner le chemin complet du fichier le plus récent
-        latest_ply = os.path.join(ply_dir, ply_files[0])
         return latest_ply
     
+    def _abort_pending_sync(self):
+        """Attend le Clean lancé en avance et ferme sa connexion si la synchronisation n'a pas eu lieu"""
+        if self.server_sync is None or self.sync_completed:
+            return
+        if self.clean_future is not None:
+            try:
+                self.clean_future.result()
+            except Exception as e:
+                self.logger.error("Erreur pendant le Clean anticipé: %s", e)
+        self.server_sync.shutdown()
+    
     def run_workflow(self):
         """Exécute le workflow complet"""
         start_time = time.time()
         self.logger.info("=== DÉMARRAGE DU WORKFLOW COMPLET ===")
         
-        # Étape 1: Acquisition
-        if not self.run_acquisition():
-            self.logger.error("Le workflow a été interrompu à l'étape d'acquisition")
-            return False
-        
-        # Étape 2: Synchronisation
-        if not self.run_sync():
-            self.logger.error("Le workflow a été interrompu à l'étape de synchronisation")
-            return False
+        # Lancer Clean sur le serveur pendant l'acquisition: il ne dépend pas des nouvelles images.
+        # La connexion et la vérification du verrou (qui peut demander une confirmation)
+        # se font ici, sur le thread principal, avant que l'acquisition n'utilise la console;
+        # le Clean en arrière-plan ne lit jamais l'entrée standard
+        if not self.args.skip_acquisition and not self.args.skip_sync:
+            from sync.server_sync import ServerSync
+            
+            self.server_sync = ServerSync(self.args)
+            if self.server_sync.initialize():
+                executor = ThreadPoolExecutor(max_workers=1)
+                self.clean_future = executor.submit(self.server_sync.run_clean, interactive=False)
+                executor.shutdown(wait=False)
+            else:
+                self.logger.warning("Synchronisation non initialisée (connexion ou verrou): Clean lancé après l'acquisition")
         
-        # Étape 3: Ciblage
-        if not self.run_targeting():
-            self.logger.error("Le workflow a été interrompu à l'étape de ciblage")
-            return False
+        # Étapes exécutées dans l'ordre; la première en échec arrête le workflow
+        steps = [
+            ("acquisition", self.run_acquisition),
+            ("synchronisation", self.run_sync),
+            ("ciblage", self.run_targeting),
+        ]
+        for name, run_step in steps:
+            step_start = time.monotonic()
+            try:
+                success = run_step()
+            except Exception as e:
+                self.logger.exception("Erreur pendant l'étape %s: %s", name, e)
+                success = False
+            self.step_times[name] = time.monotonic() - step_start
+            
+            if not success:
+                self.logger.error("Le workflow a été interrompu à l'étape: %s", name)
+                self._abort_pending_sync()
+                return False
         
         # Workflow complet terminé
         elapsed_time = time.time() - start_time
@@ -237,12 +285,14 @@ class WorkflowManager:
         minutes, seconds = divmod(remainder, 60)
         
         self.logger.info("\n=== WORKFLOW COMPLET TERMINÉ AVEC SUCCÈS ===")
-        self.logger.info(f"Temps total: {int(hours):02}h {int(minutes):02}m {int(seconds):02}s")
+        self.logger.info("Temps total: %02dh %02dm %02ds", hours, minutes, seconds)
+        for name, duration in self.step_times.items():
+            self.logger.info("  - %s: %.1fs", name, duration)
         
         return True
 
-def parse_arguments():
-    """Parse les arguments de la ligne de commande"""
+def _build_parser():
+    """Construit le parseur des arguments de la ligne de commande"""
     parser = argparse.ArgumentParser(description="Workflow complet d'acquisition, synchronisation et ciblage")
     
     # Options générales du workflow
@@ -287,6 +337,9 @@ def parse_arguments():
     target_group.add_argument("--louvain_coeff", type=float, default=0.5, 
                          help="Coefficient pour la détection Louvain (défaut: 0.5)")
     
+    target_group.add_argument("--leiden", action="store_true", 
+                         help="Détecter les communautés avec Leiden au lieu de Louvain (nécessite leidenalg)")
+    
     target_group.add_argument("--distance", type=float, default=0.4, 
                          help="Distance aux feuilles cibles en mètres (défaut: 0.4 m)")
     
@@ -327,7 +380,17 @@ def parse_arguments():
     sync_group.add_argument("--dry-run", action="store_true",
                        help="Mode simulation pour la synchronisation (pas d'exécution réelle)")
     
-    return parser.parse_args()
+    sync_group.add_argument("--compress", action="store_true",
+                       help="Compresser le transport SSH pour la synchronisation (liens lents)")
+    
+    return parser
+
+# Parseur construit une seule fois, à l'import du script
+_PARSER = _build_parser()
+
+def parse_arguments():
+    """Parse les arguments de la ligne de commande"""
+    return _PARSER.parse_args()
 
 def main():
     """Fonction principale"""
@@ -336,6 +399,13 @@ def main():
     # Parser les arguments
     args = parse_arguments()
     
+    # Configuration du logging (une seule fois pour tout le processus)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    
     # Créer et exécuter le workflow
     workflow = WorkflowManager(args)
     success = workflow.run_workflow()
@@ -9,11 +9,40 @@ et le lancement des traitements sur le serveur.
 
 import time
 import os
+import json
 import logging
-import sys
+import random
+import shlex
+import posixpath
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from sync.ssh_manager import SSHManager, handle_lock_removal
 from core.utils import config
+from core.data.storage_manager import LATEST_INDEX_FILE
+
+# Logger du module (configuré une seule fois par le script appelant)
+logger = logging.getLogger(__name__)
+
+# Nombre maximal de tentatives avant de demander la suppression du verrou
+LOCK_RETRY_ATTEMPTS = 5
+# Délai maximal (en secondes) entre deux tentatives
+LOCK_RETRY_MAX_DELAY = 30
+# Suffixe du répertoire de transit de l'upload fait pendant Clean: répertoire frère
+# du scan distant (même système de fichiers, hors de l'arborescence nettoyée par Clean)
+UPLOAD_STAGING_SUFFIX = ".upload_staging"
+# Valeurs de repli des paramètres absents de la configuration
+# (chaque clé donne l'attribut du même nom en minuscules)
+_DEFAULTS = {
+    "SSH_HOST": "10.0.7.22",
+    "SSH_USER": "ayman",
+    "KEY_PATH": "/home/romi/.ssh/id_rsa",
+    "REMOTE_WORK_PATH": "/mnt/diskSustainability/Scanner_Data/scanner_lyon/3dt_colA/Col_A_2021-01-29/",
+    "LOCAL_ACQUISITION_BASE": "/home/romi/ayman/results/plant_acquisition",
+    "LOCAL_PLY_TARGET": "/home/romi/ayman/PointClouds",
+    "ROMI_CONFIG": "~/plant-3d-vision/configs/geom_pipe_real.toml",
+}
+# Items d'une acquisition envoyés au serveur
+ACQUISITION_ITEMS = ["images", "metadata", "files.json", "scan.toml"]
 
 class ServerSync:
     def __init__(self, args=None):
@@ -23,23 +52,14 @@ class ServerSync:
         Args:
             args: Arguments de la ligne de commande (optionnel)
         """
-        # Configuration du logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[logging.StreamHandler(sys.stdout)]
-        )
-        self.logger = logging.getLogger("sync")
-        
-        # Paramètres par défaut
-        self.ssh_host = config.SSH_HOST if hasattr(config, 'SSH_HOST') else "10.0.7.22"
-        self.ssh_user = config.SSH_USER if hasattr(config, 'SSH_USER') else "ayman"
-        self.key_path = config.KEY_PATH if hasattr(config, 'KEY_PATH') else "/home/romi/.ssh/id_rsa"
-        self.remote_work_path = config.REMOTE_WORK_PATH if hasattr(config, 'REMOTE_WORK_PATH') else "/mnt/diskSustainability/Scanner_Data/scanner_lyon/3dt_colA/Col_A_2021-01-29/"
-        self.local_acquisition_base = config.LOCAL_ACQUISITION_BASE if hasattr(config, 'LOCAL_ACQUISITION_BASE') else "/home/romi/ayman/results/plant_acquisition"
-        self.local_ply_target = config.LOCAL_PLY_TARGET if hasattr(config, 'LOCAL_PLY_TARGET') else "/home/romi/ayman/PointClouds"
-        self.romi_config = config.ROMI_CONFIG if hasattr(config, 'ROMI_CONFIG') else "~/plant-3d-vision/configs/geom_pipe_real.toml"
+        self.logger = logger
+        
+        # Paramètres par défaut (config.json, sinon valeurs de repli)
+        for key, default in _DEFAULTS.items():
+            setattr(self, key.lower(), getattr(config, key, default))
+        
         self.dry_run = False  # Mode simulation
+        self.compress = False  # Compression du transport SSH
         
         # Mettre à jour les paramètres avec les arguments de la ligne de commande
         if args:
@@ -50,6 +70,7 @@ class ServerSync:
         
         # État
         self.initialized = False
+        self.clean_done = False
     
     def update_from_args(self, args):
         """Met à jour les paramètres depuis les arguments de la ligne de commande"""
@@ -73,6 +94,9 @@ class ServerSync:
             
         if hasattr(args, 'dry_run') and args.dry_run:
             self.dry_run = args.dry_run
+            
+        if hasattr(args, 'compress') and args.compress:
+            self.compress = args.compress
     
     def initialize(self):
         """Initialise la connexion SSH"""
@@ -87,7 +111,8 @@ class ServerSync:
                 self.ssh_host, 
                 self.ssh_user, 
                 self.key_path, 
-                dry_run=self.dry_run
+                dry_run=self.dry_run,
+                compress=self.compress
             )
             
             # Connecter
@@ -113,42 +138,215 @@ class ServerSync:
     def find_latest_acquisition(self):
         """Trouve le répertoire circular_scan_* le plus récent"""
         base_path = self.local_acquisition_base
-        pattern = "circular_scan_*"
+        prefix = "circular_scan_"
+        
+        # Index écrit par l'acquisition: une lecture au lieu de lister le répertoire
+        latest_path, timestamp = self.read_latest_index(base_path, prefix)
+        if latest_path is not None:
+            self.logger.info("[TROUVÉ] Dernière acquisition trouvée (index): %s", latest_path.name)
+            return latest_path, timestamp
         
         try:
-            base_path = Path(base_path)
-            candidates = list(base_path.glob(pattern))
+            # Un seul parcours: filtre par préfixe et stat en cache des DirEntry
+            latest = None
+            latest_mtime = -1
+            with os.scandir(base_path) as entries:
+                for entry in entries:
+                    if not entry.name.startswith(prefix) or not entry.is_dir(follow_symlinks=False):
+                        continue
+                    mtime = entry.stat().st_mtime
+                    if mtime > latest_mtime:
+                        latest_mtime = mtime
+                        latest = entry
             
-            if not candidates:
-                self.logger.error("[ERREUR] Aucun répertoire '%s' trouvé dans %s", pattern, base_path)
+            if latest is None:
+                self.logger.error("[ERREUR] Aucun répertoire '%s*' trouvé dans %s", prefix, base_path)
                 return None, None
-                
-            # Trier par date de modification
-            latest = max(candidates, key=os.path.getmtime)
             
             # Extraire le timestamp du nom
-            timestamp = latest.name.replace("circular_scan_", "")
+            timestamp = latest.name[len(prefix):]
             
             self.logger.info("[TROUVÉ] Dernière acquisition trouvée: %s", latest.name)
-            return latest, timestamp
+            return Path(latest.path), timestamp
             
         except Exception as e:
             self.logger.error("[ERREUR] Erreur lors de la recherche: %s", str(e))
             return None, None
     
-    def run_sync(self):
-        """Exécute le processus de synchronisation complet"""
+    def read_latest_index(self, base_path, prefix):
+        """
+        Lit l'index de la dernière acquisition écrit par StorageManager
+        
+        L'index est ignoré (repli sur le parcours complet) si le répertoire indexé
+        n'existe plus ou si un répertoire '<prefix>*' plus récent existe (copie
+        manuelle, acquisition interrompue avant la mise à jour de l'index). Les
+        horodatages des noms se trient dans l'ordre lexical: la vérification ne
+        compare que les noms, sans stat.
+        
+        Args:
+            base_path: Répertoire des acquisitions
+            prefix: Préfixe attendu du nom de répertoire
+            
+        Returns:
+            (Path, timestamp) si l'index est valide, (None, None) sinon
+        """
+        try:
+            with open(os.path.join(base_path, LATEST_INDEX_FILE)) as f:
+                index = json.load(f)
+            name = index["name"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None, None
+        
+        latest_path = Path(base_path) / name
+        if not isinstance(name, str) or not name.startswith(prefix) or not latest_path.is_dir():
+            return None, None
+        
+        try:
+            with os.scandir(base_path) as entries:
+                for entry in entries:
+                    if (entry.name.startswith(prefix) and entry.name > name
+                            and entry.is_dir(follow_symlinks=False)):
+                        self.logger.info("[INDEX] Index obsolète (%s plus récent que %s)",
+                                         entry.name, name)
+                        return None, None
+        except OSError:
+            return None, None
+        
+        return latest_path, name[len(prefix):]
+    
+    def exec_romi_with_backoff(self, command_args, echo=True):
+        """
+        Exécute une tâche ROMI en réessayant avec un backoff exponentiel (avec jitter)
+        tant qu'un verrou est détecté
+        
+        Args:
+            command_args: Arguments pour romi_run_task
+            echo: Afficher la sortie de la tâche en temps réel
+        
+        Returns:
+            Résultat de exec_romi_command ("lock_detected" si le verrou persiste)
+        """
+        result = "lock_detected"
+        for attempt in range(LOCK_RETRY_ATTEMPTS):
+            result = self.ssh.exec_romi_command(command_args, echo=echo)
+            if result != "lock_detected":
+                break
+            
+            # Pas d'attente après la dernière tentative
+            if attempt == LOCK_RETRY_ATTEMPTS - 1:
+                break
+            
+            delay = min(2 ** attempt, LOCK_RETRY_MAX_DELAY) + random.uniform(0, 1)
+            self.logger.info("[VERROU] Verrou détecté, nouvelle tentative dans %.1fs (tentative %d/%d)",
+                             delay, attempt + 1, LOCK_RETRY_ATTEMPTS)
+            time.sleep(delay)
+        
+        return result
+    
+    def upload_to_staging(self, uploader, latest_dir, items, staging_path):
+        """
+        Envoie les items dans un répertoire de transit sur une seconde connexion SSH
+        (exécuté en arrière-plan pendant la tâche Clean: les transports paramiko
+        sérialisent leurs canaux, d'où une connexion dédiée)
+        
+        Args:
+            uploader: SSHManager dédié, déjà connecté (fermé à la fin de l'upload;
+                le fermer plus tôt interrompt l'upload, voir abort_staging_upload)
+            latest_dir: Répertoire local de l'acquisition
+            items: Items à envoyer
+            staging_path: Répertoire distant de transit
+            
+        Returns:
+            bool: True si tous les items sont dans le répertoire de transit
+        """
+        try:
+            success, _ = uploader.exec_command(f"rm -rf {shlex.quote(staging_path)}")
+            return success and uploader.upload_items_as_tar(latest_dir, items, staging_path)
+        except Exception as e:
+            self.logger.error("[ERREUR] Erreur d'upload en arrière-plan: %s", str(e))
+            return False
+        finally:
+            uploader.close()
+    
+    def abort_staging_upload(self, uploader, upload_future, staging_path):
+        """
+        Interrompt l'upload en arrière-plan et supprime le répertoire de transit
+        
+        Fermer la connexion dédiée fait échouer l'envoi en cours: le thread
+        d'upload se termine sans attendre la fin de l'acquisition.
+        
+        Args:
+            uploader: SSHManager dédié à l'upload
+            upload_future: Future renvoyé pour upload_to_staging
+            staging_path: Répertoire distant de transit
+        """
+        self.logger.info("[NETTOYAGE] Interruption de l'upload en arrière-plan")
+        uploader.close()
+        upload_future.result()
+        self.ssh.exec_command(f"rm -rf {shlex.quote(staging_path)}")
+    
+    def upload_items(self, latest_dir, items):
+        """Upload direct des items vers le scan distant (tar, sinon item par item)"""
+        if self.ssh.upload_items_as_tar(latest_dir, items, self.remote_work_path):
+            return True
+        
+        self.logger.warning("[ATTENTION] Envoi tar impossible, repli sur l'upload item par item")
+        if not items:
+            return True
+        
+        # Les petits items (json, toml) s'envoient pendant le gros répertoire images
+        with ThreadPoolExecutor(max_workers=len(items)) as executor:
+            futures = {}
+            for item in items:
+                self.logger.info("[ENVOI] Copie: %s", item)
+                future = executor.submit(
+                    self.ssh.upload_path, latest_dir / item, f"{self.remote_work_path}{item}"
+                )
+                futures[future] = item
+            
+            for future in as_completed(futures):
+                if not future.result():
+                    self.logger.error("[ERREUR] Échec de la copie de %s", futures[future])
+                    for pending in futures:
+                        pending.cancel()
+                    return False
+        return True
+    
+    def run_clean(self, interactive=True):
+        """
+        Lance la tâche Clean sur le scan distant
+        
+        Clean ne dépend pas des nouvelles images: elle peut être lancée à l'avance
+        (pendant l'acquisition), run_sync ne la relance pas si elle a déjà réussi.
+        
+        Args:
+            interactive: False hors du thread principal: la connexion doit déjà être
+                initialisée (vérification du verrou faite), la sortie de ROMI n'est pas
+                affichée et un verrou fait échouer Clean au lieu de demander sa
+                suppression (run_sync relance alors Clean sur le thread principal)
+        
+        Returns:
+            bool: True si Clean a réussi, False sinon
+        """
+        if self.clean_done:
+            self.logger.info("[NETTOYAGE] Clean déjà effectué")
+            return True
+        
+        if not interactive and not self.initialized:
+            self.logger.error("[ERREUR] Clean non interactif sans connexion initialisée")
+            return False
+        
         if not self.initialize():
             return False
         
         try:
-            # 1. Lancer Clean
-            self.logger.info("[NETTOYAGE] Étape 1/6: Nettoyage initial (Clean)")
             clean_args = f"Clean {self.remote_work_path} --config {self.romi_config}"
-            result = self.ssh.exec_romi_command(clean_args)
+            result = self.exec_romi_with_backoff(clean_args, echo=interactive)
             
             if result == "lock_detected":
                 self.logger.warning("[VERROU] Verrou de base de données détecté pendant Clean")
+                if not interactive:
+                    return False
                 lock_result = handle_lock_removal(self.ssh)
                 if lock_result == "exit_script":
                     return False
@@ -156,42 +354,97 @@ class ServerSync:
                 self.logger.error("[ERREUR] Échec de la tâche Clean")
                 return False
             
-            # 2. Supprimer les anciens fichiers du serveur
-            self.logger.info("[SUPPRESSION] Étape 2/6: Suppression des anciens fichiers")
-            items_to_remove = ["images", "metadata", "files.json", "scan.toml"]
-            for item in items_to_remove:
-                cmd = f"rm -rf '{self.remote_work_path}{item}'"
-                success, _ = self.ssh.exec_command(cmd)
-                if not success:
-                    self.logger.warning("[ATTENTION] Impossible de supprimer %s (peut-être absent)", item)
-            
-            # 3. Trouver la dernière acquisition locale
-            self.logger.info("[RECHERCHE] Étape 3/6: Recherche de la dernière acquisition")
+            self.clean_done = True
+            return True
+            
+        except Exception as e:
+            self.logger.error("[ERREUR] Erreur pendant Clean: %s", str(e))
+            return False
+    
+    def run_sync(self):
+        """Exécute le processus de synchronisation complet"""
+        if not self.initialize():
+            return False
+        
+        # Upload en arrière-plan pas encore consommé (interrompu en cas de sortie anticipée)
+        upload_future = None
+        
+        try:
+            # 1. Trouver la dernière acquisition locale
+            self.logger.info("[RECHERCHE] Étape 1/6: Recherche de la dernière acquisition")
             latest_dir, timestamp = self.find_latest_acquisition()
             if not latest_dir:
                 return False
             
-            # 4. Copier les nouveaux fichiers vers le serveur
-            self.logger.info("[ENVOI] Étape 4/6: Upload des nouvelles données")
-            items_to_copy = ["images", "metadata", "files.json", "scan.toml"]
+            # Une seule lecture du répertoire au lieu d'un stat par item
+            with os.scandir(latest_dir) as entries:
+                present = {entry.name for entry in entries}
             
-            for item in items_to_copy:
-                src_path = latest_dir / item
-                dst_path = f"{self.remote_work_path}{item}"
-                
-                if not src_path.exists():
-                    self.logger.warning("[ATTENTION] Item manquant (ignoré): %s", src_path)
+            items_to_copy = []
+            for item in ACQUISITION_ITEMS:
+                if item not in present:
+                    self.logger.warning("[ATTENTION] Item manquant (ignoré): %s", latest_dir / item)
                     continue
+                items_to_copy.append(item)
+            
+            # Si Clean reste à faire, démarrer l'upload en arrière-plan vers un
+            # répertoire de transit pour le recouvrir avec Clean (seconde connexion
+            # établie ici: une sortie anticipée peut la fermer pour interrompre l'upload).
+            # Sinon l'upload se fait directement à l'étape 4, sur la connexion principale
+            if not self.clean_done:
+                scan_dir = self.remote_work_path.rstrip('/')
+                staging_path = posixpath.join(
+                    posixpath.dirname(scan_dir),
+                    f".{posixpath.basename(scan_dir)}{UPLOAD_STAGING_SUFFIX}/"
+                )
+                uploader = SSHManager(self.ssh_host, self.ssh_user, self.key_path,
+                                      dry_run=self.dry_run, compress=self.compress)
+                if uploader.connect():
+                    upload_executor = ThreadPoolExecutor(max_workers=1)
+                    upload_future = upload_executor.submit(
+                        self.upload_to_staging, uploader, latest_dir, items_to_copy, staging_path
+                    )
+                    upload_executor.shutdown(wait=False)
+            
+            # 2. Lancer Clean
+            self.logger.info("[NETTOYAGE] Étape 2/6: Nettoyage initial (Clean)")
+            if not self.run_clean():
+                return False
+            
+            # 3. Supprimer les anciens fichiers du serveur
+            self.logger.info("[SUPPRESSION] Étape 3/6: Suppression des anciens fichiers")
+            # Une seule commande pour tous les items (rm -rf ignore les absents)
+            paths = " ".join(shlex.quote(f"{self.remote_work_path}{item}") for item in ACQUISITION_ITEMS)
+            success, _ = self.ssh.exec_command(f"rm -rf {paths}")
+            if not success:
+                self.logger.warning("[ATTENTION] Impossible de supprimer les anciens fichiers")
+            
+            # 4. Mettre en place les nouveaux fichiers
+            self.logger.info("[ENVOI] Étape 4/6: Upload des nouvelles données")
+            staged = False
+            if upload_future is not None:
+                staged = upload_future.result()
+                upload_future = None
+                if staged:
+                    # Simple renommage sur le même système de fichiers
+                    commands = [
+                        f"mv {shlex.quote(staging_path + item)} {shlex.quote(self.remote_work_path + item)}"
+                        for item in items_to_copy
+                    ]
+                    commands.append(f"rmdir {shlex.quote(staging_path)}")
+                    staged, _ = self.ssh.exec_command(" && ".join(commands))
                 
-                self.logger.info("[ENVOI] Copie: %s", item)
-                if not self.ssh.upload_path(src_path, dst_path):
-                    self.logger.error("[ERREUR] Échec de la copie de %s", item)
-                    return False
+                if not staged:
+                    self.logger.warning("[ATTENTION] Upload en arrière-plan indisponible, envoi direct")
+                    self.ssh.exec_command(f"rm -rf {shlex.quote(staging_path)}")
+            
+            if not staged and not self.upload_items(latest_dir, items_to_copy):
+                return False
             
             # 5. Lancer PointCloud
             self.logger.info("[TRAITEMENT] Étape 5/6: Génération du nuage de points (PointCloud)")
             pointcloud_args = f"PointCloud {self.remote_work_path} --config {self.romi_config}"
-            result = self.ssh.exec_romi_command(pointcloud_args)
+            result = self.exec_romi_with_backoff(pointcloud_args)
             
             if result == "lock_detected":
                 self.logger.warning("[VERROU] Verrou de base de données détecté pendant PointCloud")
@@ -205,16 +458,15 @@ class ServerSync:
             # 6. Récupérer le fichier PLY
             self.logger.info("[TÉLÉCHARGEMENT] Étape 6/6: Récupération du nuage de points")
             
-            # Trouver le répertoire PointCloud*
-            find_cmd = f"find '{self.remote_work_path}' -name 'PointCloud*' -type d | head -1"
-            success, pointcloud_dir = self.ssh.exec_command(find_cmd)
+            # Trouver le répertoire PointCloud* le plus récent
+            pointcloud_dir = self.ssh.find_latest_remote_dir(self.remote_work_path, "PointCloud")
             
-            if not success or not pointcloud_dir:
+            if not pointcloud_dir:
                 self.logger.error("[ERREUR] Impossible de trouver le répertoire PointCloud")
                 return False
             
             # Télécharger le fichier PLY
-            remote_ply = f"{pointcloud_dir.strip()}/PointCloud.ply"
+            remote_ply = f"{pointcloud_dir}/PointCloud.ply"
             local_ply = f"{self.local_ply_target}/PointCloud_{timestamp}.ply"
             
             if not self.ssh.download_file(remote_ply, local_ply):
@@ -223,8 +475,7 @@ class ServerSync:
             
             self.logger.info("[SUCCÈS] Fichier PLY récupéré: %s", local_ply)
             
-            # 7. Fermeture propre
-            self.ssh.close()
+            # 7. Fermeture propre (dans le finally)
             self.logger.info("[TERMINÉ] Synchronisation terminée avec succès")
             return True
             
@@ -235,6 +486,8 @@ class ServerSync:
             self.logger.error("[ERREUR] Erreur inattendue: %s", str(e), exc_info=True)
             return False
         finally:
+            if upload_future is not None:
+                self.abort_staging_upload(uploader, upload_future, staging_path)
             if self.ssh:
                 self.ssh.close()
     
@@ -5,23 +5,135 @@
 Gestionnaire de connexion SSH avec gestion des erreurs améliorée
 """
 
-import paramiko
 import os
+import re
+import posixpath
+import sys
 import time
+import shlex
+import stat
+import shutil
+import queue
+import threading
+import select
 import logging
+import tarfile
+import zipfile
+import zlib
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+# Logger du module (configuré une seule fois par le script appelant)
+logger = logging.getLogger(__name__)
+
+# Patterns indiquant un verrou de la base ROMI dans la sortie de romi_run_task
+LOCK_PATTERNS = [
+    "DBBusyError",
+    "File lock exists", 
+    "DB is busy, cannot connect",
+    "File exists: '/mnt/diskSustainability/Scanner_Data/scanner_lyon/3dt_colA/lock'",
+    "FileExistsError: [Errno 17] File exists:",
+    "/lock'"  # Pattern plus simple pour le chemin du fichier lock
+]
+# Fichier de verrou de la base ROMI
+LOCK_FILE = "/mnt/diskSustainability/Scanner_Data/scanner_lyon/3dt_colA/lock"
+# Une seule expression pour tous les patterns, appliquée au flux de sortie brut (bytes)
+_LOCK_RE = re.compile(b"|".join(re.escape(pattern.encode()) for pattern in LOCK_PATTERNS))
+# Octets conservés entre deux lectures pour watch_re (un pattern peut être coupé en deux)
+_WATCH_TAIL_SIZE = max(len(pattern.encode()) for pattern in LOCK_PATTERNS) - 1
+
+# Début de la sortie conservé pour le débogage (le reste n'est qu'affiché)
+OUTPUT_HEAD_SIZE = 500
+
+# Environnement préparé une seule fois dans le shell persistant des tâches ROMI
+ROMI_SHELL_SETUP = (
+    "export PYTHONPATH=/home/ayman/plant-3d-vision && "
+    "unset ROMI_DB && "
+    "cd /home/ayman/plant-3d-vision"
+)
+# Sentinelle affichée après chaque commande, suivie du code de sortie
+SHELL_SENTINEL = "__ROMI_DONE_"
+_SHELL_SENTINEL_RE = re.compile(rb"__ROMI_DONE_(\d+)__")
+# Octets retenus avant affichage: la fin du flux peut être le début d'une sentinelle
+# coupée entre deux lectures (sentinelle + code de sortie sur 3 chiffres + "__")
+_SENTINEL_HOLD_SIZE = len(SHELL_SENTINEL) + 5
+# Attente maximale (s) de la fin de la ligne de la sentinelle
+SHELL_DRAIN_TIMEOUT = 5
+
+# Fenêtre SSH élargie: évite d'attendre les ACK de fenêtre pendant les transferts
+# (passée au constructeur du Transport, héritée par tous les canaux)
+SSH_WINDOW_SIZE = 2 ** 27
+# Taille maximale des paquets d'un canal (32 Ko, valeur standard: OpenSSH refuse
+# les paquets de plus de 256 Ko en-têtes compris, la fenêtre suffit au débit)
+SSH_MAX_PACKET_SIZE = 1 << 15
+
+# Tampon des fichiers locaux (1 Mo: lectures/écritures disque groupées)
+LOCAL_IO_BUFFER = 1 << 20
+
+# Taille des lectures sur un canal SSH
+CHANNEL_RECV_SIZE = 65536
+
+# Durée maximale (s) d'une commande système simple (exec_command)
+EXEC_COMMAND_TIMEOUT = 300
+
+# Intervalle (s) des paquets keepalive sur la connexion persistante
+SSH_KEEPALIVE_INTERVAL = 30
+
+# Requêtes de lecture simultanées lors d'un téléchargement (limite interne d'OpenSSH)
+SFTP_PREFETCH_REQUESTS = 64
+
+# Tentatives de connexion SSH avant abandon (erreurs de transport ou réseau uniquement,
+# attente doublée entre chaque)
+SSH_CONNECT_ATTEMPTS = 3
+# Délais d'attente explicites de la bannière et de l'authentification SSH
+SSH_BANNER_TIMEOUT = 60
+SSH_AUTH_TIMEOUT = 30
+
+# Nombre de clients SFTP utilisés en parallèle pour l'upload fichier par fichier
+SFTP_POOL_SIZE = 4
+
+
+def _write_raw(data):
+    """Écrit des octets bruts sur la sortie standard sans décodage ni flush"""
+    sys.stdout.buffer.write(data)
+
+
+class _ChannelWriter:
+    """Adaptateur fichier (écriture seule, non seekable) au-dessus d'un canal SSH"""
+    
+    def __init__(self, channel):
+        self.channel = channel
+    
+    def write(self, data):
+        self.channel.sendall(data)
+        return len(data)
+    
+    def flush(self):
+        pass
+
+
 class SSHManager:
     """Gestionnaire de connexion SSH avec gestion des erreurs améliorée"""
     
-    def __init__(self, host, username, key_path, dry_run=False):
+    def __init__(self, host, username, key_path, dry_run=False, compress=False):
         self.host = host
         self.username = username
         self.key_path = key_path
         self.dry_run = dry_run
+        # Compression zlib du transport SSH (utile sur un lien lent, inutile pour les JPEG)
+        self.compress = compress
+        # Clé privée chargée une seule fois, réutilisée à chaque reconnexion
+        self.pkey = None
         self.ssh = None
         self.sftp = None
-        self.logger = logging.getLogger("sync.ssh")
+        self.interactive_shell = None
+        self.sftp_pool = None
+        self.sftp_pool_lock = threading.Lock()
+        self.extra_sftp_clients = []
+        # Répertoires distants déjà créés (évite de les recréer entre deux appels)
+        self.created_dirs = set()
+        self.logger = logger
         
     def connect(self):
         """Établit la connexion SSH et SFTP"""
@@ -30,20 +142,51 @@ class SSHManager:
             return True
             
         try:
-            self.logger.info("Connexion à %s@%s...", self.username, self.host)
-            self.ssh = paramiko.SSHClient()
-            self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            self.ssh.connect(
-                self.host, 
-                username=self.username, 
-                key_filename=self.key_path,
-                timeout=300
-            )
+            # Import différé: paramiko (et cryptography) ne sont chargés qu'à la vraie connexion
+            import paramiko
             
-            # Vérifier que la connexion fonctionne
-            _, stdout, _ = self.ssh.exec_command("echo 'SSH connection test'")
-            result = stdout.read().decode().strip()
-            if not result:
+            if self.pkey is None:
+                self.pkey = self.load_private_key(paramiko, self.key_path)
+            
+            for attempt in range(SSH_CONNECT_ATTEMPTS):
+                self.logger.info("Connexion à %s@%s...", self.username, self.host)
+                self.ssh = paramiko.SSHClient()
+                self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                try:
+                    self.ssh.connect(
+                        self.host, 
+                        username=self.username, 
+                        pkey=self.pkey,
+                        timeout=300,
+                        compress=self.compress,
+                        banner_timeout=SSH_BANNER_TIMEOUT,
+                        auth_timeout=SSH_AUTH_TIMEOUT,
+                        # Les canaux ouverts ensuite (SFTP, exec) héritent de ces valeurs
+                        transport_factory=functools.partial(
+                            paramiko.Transport,
+                            default_window_size=SSH_WINDOW_SIZE,
+                            default_max_packet_size=SSH_MAX_PACKET_SIZE
+                        )
+                    )
+                    break
+                except (paramiko.AuthenticationException, paramiko.BadHostKeyException):
+                    # Clé, utilisateur ou hôte refusés: une nouvelle tentative échouerait aussi
+                    self.ssh.close()
+                    raise
+                except (paramiko.SSHException, OSError) as e:
+                    self.ssh.close()
+                    if attempt == SSH_CONNECT_ATTEMPTS - 1:
+                        raise
+                    delay = 2 ** attempt
+                    self.logger.warning("Connexion échouée (%s), nouvelle tentative dans %ds", str(e), delay)
+                    time.sleep(delay)
+            
+            transport = self.ssh.get_transport()
+            # Garder la connexion ouverte pendant les longues tâches ROMI
+            transport.set_keepalive(SSH_KEEPALIVE_INTERVAL)
+            
+            # Vérifier que la connexion fonctionne (sans ouvrir de canal)
+            if not transport.is_active():
                 self.logger.error("Test de connexion SSH échoué")
                 return False
                 
@@ -54,12 +197,33 @@ class SSHManager:
             self.logger.error("❌ Erreur de connexion SSH: %s", str(e))
             return False
     
-    def exec_romi_command(self, command_args):
+    @staticmethod
+    def load_private_key(paramiko, key_path):
+        """
+        Charge la clé privée SSH (RSA, puis Ed25519, puis ECDSA)
+        
+        Args:
+            paramiko: Module paramiko (importé à la connexion)
+            key_path: Chemin de la clé privée
+            
+        Returns:
+            Clé privée paramiko
+        """
+        key_path = os.path.expanduser(key_path)
+        for key_class in (paramiko.RSAKey, paramiko.Ed25519Key, paramiko.ECDSAKey):
+            try:
+                return key_class.from_private_key_file(key_path)
+            except paramiko.SSHException:
+                continue
+        raise paramiko.SSHException(f"Format de clé non reconnu: {key_path}")
+    
+    def exec_romi_command(self, command_args, echo=True):
         """
         Exécute une commande romi_run_task avec l'environnement correct
         
         Args:
             command_args: Arguments pour romi_run_task (ex: "Clean /path/to/scan --config /path/to/config")
+            echo: Afficher la sortie de la tâche en temps réel (False hors du thread principal)
         
         Returns:
             True si succès, False sinon, "lock_detected" si verrou détecté
@@ -75,77 +239,21 @@ class SSHManager:
         try:
             self.logger.info("[EXÉCUTION] romi_run_task %s", command_args)
             
-            # Créer un canal avec PTY pour avoir l'environnement complet
-            channel = self.ssh.get_transport().open_session()
-            channel.get_pty()
-            
-            # Commande avec environnement correct (basé sur nos tests précédents)
-            full_command = (
-                "bash -l -c '"
-                "export PYTHONPATH=/home/ayman/plant-3d-vision && "
-                "unset ROMI_DB && "
-                "cd /home/ayman/plant-3d-vision && "
-                f"/home/ayman/.local/bin/romi_run_task {command_args}"
-                "'"
-            )
-            
-            channel.exec_command(full_command)
-            
-            # Afficher la sortie en temps réel et capturer pour détecter le verrou
-            output_lines = []
-            stderr_lines = []
-            
-            while True:
-                if channel.recv_ready():
-                    data = channel.recv(1024).decode('utf-8')
-                    print(data, end='')
-                    output_lines.append(data)
-                    
-                if channel.recv_stderr_ready():
-                    data = channel.recv_stderr(1024).decode('utf-8')
-                    print(f"STDERR: {data}", end='')
-                    stderr_lines.append(data)
-                    
-                if channel.exit_status_ready():
-                    break
-                    
-                time.sleep(0.1)  # Petite pause pour éviter la surcharge CPU
-            
-            # Après la fin, lire tout ce qui reste
-            time.sleep(0.5)  # Attendre un peu plus pour être sûr
-            while channel.recv_ready():
-                data = channel.recv(1024).decode('utf-8')
-                output_lines.append(data)
-                print(data, end='')
-            while channel.recv_stderr_ready():
-                data = channel.recv_stderr(1024).decode('utf-8')
-                stderr_lines.append(data)
-                print(f"STDERR: {data}", end='')
-            
-            exit_status = channel.recv_exit_status()
-            channel.close()
+            # L'environnement (PYTHONPATH, ROMI_DB, répertoire) est préparé par le shell persistant
+            full_command = f"/home/ayman/.local/bin/romi_run_task {command_args}"
             
-            # Vérifier s'il y a une erreur de verrou dans toute la sortie
-            full_output = "".join(output_lines + stderr_lines)
+            exit_status, output_head, lock_match = self.exec_interactive(full_command, watch_re=_LOCK_RE, echo=echo)
             
             # Debug: afficher ce qu'on a capturé (en mode debug uniquement)
-            if exit_status != 0:
-                self.logger.debug("Sortie capturée pour analyse: %s", full_output[:500] + "..." if len(full_output) > 500 else full_output)
-            
-            # Détecter les différents patterns d'erreur de verrou
-            lock_patterns = [
-                "DBBusyError",
-                "File lock exists", 
-                "DB is busy, cannot connect",
-                "File exists: '/mnt/diskSustainability/Scanner_Data/scanner_lyon/3dt_colA/lock'",
-                "FileExistsError: [Errno 17] File exists:",
-                "/lock'"  # Pattern plus simple pour le chemin du fichier lock
-            ]
+            if exit_status != 0 and self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Début de la sortie pour analyse: %s",
+                                  output_head.decode('utf-8', errors='replace'))
             
-            for pattern in lock_patterns:
-                if pattern in full_output:
-                    self.logger.warning("[VERROU] Détection du pattern de verrou: %s", pattern)
-                    return "lock_detected"
+            # Pattern de verrou repéré pendant la lecture du flux
+            if lock_match is not None:
+                self.logger.warning("[VERROU] Détection du pattern de verrou: %s",
+                                    lock_match.decode('utf-8', errors='replace'))
+                return "lock_detected"
             
             if exit_status == 0:
                 self.logger.info("[SUCCÈS] Commande romi_run_task réussie")
@@ -158,6 +266,140 @@ class SSHManager:
             self.logger.error("[ERREUR] Erreur lors de l'exécution de la commande ROMI: %s", str(e))
             return False
     
+    def get_interactive_shell(self):
+        """
+        Retourne le shell interactif (login + PTY) partagé par toutes les tâches ROMI
+        
+        Le shell est ouvert une seule fois et l'environnement ROMI y est préparé une
+        seule fois; les tâches suivantes réutilisent le même canal.
+        """
+        if self.interactive_shell is not None and not self.interactive_shell.closed:
+            return self.interactive_shell
+        
+        channel = self.ssh.get_transport().open_session()
+        channel.get_pty()
+        channel.invoke_shell()
+        
+        # Pas d'écho ni de prompt: seule la sortie des commandes est affichée
+        channel.sendall(f"stty -echo; PS1=''; {ROMI_SHELL_SETUP}\n".encode())
+        
+        self.interactive_shell = channel
+        return channel
+    
+    def exec_interactive(self, command, watch_re=None, echo=True):
+        """
+        Exécute une commande dans le shell interactif persistant, en affichant la
+        sortie en temps réel
+        
+        Toutes les commandes réutilisent la même connexion et le même canal, ce qui
+        évite un nouvel échange de clés, une allocation de PTY et un démarrage de
+        shell de login pour chaque tâche. La fin de la commande et son code de
+        sortie sont repérés grâce à une sentinelle affichée après la commande.
+        Pour les appels au client OpenSSH en ligne de commande, l'équivalent est un
+        ControlMaster dans ~/.ssh/config (ControlMaster auto, ControlPath,
+        ControlPersist 10m).
+        
+        Args:
+            command: Commande complète à exécuter
+            watch_re: Expression (bytes) recherchée au fil du flux de sortie (optionnel)
+            echo: Afficher la sortie en temps réel (seul le début est conservé sinon)
+        
+        Returns:
+            Tuple (code de sortie, début de la sortie en bytes, premier texte trouvé
+            par watch_re ou None); stdout et stderr sont fusionnés par le PTY
+        """
+        channel = self.get_interactive_shell()
+        
+        # Écarter un reste éventuel de la commande précédente: il ne doit pas être
+        # lu comme la sortie de celle-ci
+        while channel.recv_ready():
+            channel.recv(CHANNEL_RECV_SIZE)
+        
+        channel.sendall(f"{command}; echo {SHELL_SENTINEL}$?__\n".encode())
+        
+        # Afficher la sortie en temps réel; seul le début est conservé
+        output_head = b""
+        pending = b""
+        watch_tail = b""
+        watch_match = None
+        exit_status = None
+        
+        def consume(data):
+            """Affiche et analyse un bloc de sortie (sans la sentinelle)"""
+            nonlocal output_head, watch_tail, watch_match
+            if echo:
+                _write_raw(data)
+            if len(output_head) < OUTPUT_HEAD_SIZE:
+                output_head += data[:OUTPUT_HEAD_SIZE - len(output_head)]
+            
+            # Recherche en un seul passage, sur la fin du bloc précédent + le nouveau
+            if watch_re is not None and watch_match is None:
+                chunk = watch_tail + data
+                found = watch_re.search(chunk)
+                if found:
+                    watch_match = found.group(0)
+                watch_tail = chunk[-_WATCH_TAIL_SIZE:]
+        
+        # La sortie reste en bytes: elle n'est décodée que pour le débogage.
+        # select() bloque jusqu'à l'arrivée de données au lieu de scruter le canal
+        if echo:
+            sys.stdout.flush()
+        while exit_status is None:
+            select.select([channel], [], [], 1.0)
+            
+            while channel.recv_ready():
+                pending += channel.recv(CHANNEL_RECV_SIZE)
+                
+                match = _SHELL_SENTINEL_RE.search(pending)
+                if match:
+                    exit_status = int(match.group(1))
+                    # Ni la sentinelle ni la fin de sa ligne ne sont affichées
+                    consume(pending[:match.start()])
+                    self._drain_sentinel_line(channel, pending[match.end():])
+                    pending = b""
+                    break
+                
+                # Retenir la fin du flux, qui peut être le début d'une sentinelle
+                ready = len(pending) - _SENTINEL_HOLD_SIZE
+                if ready > 0:
+                    consume(pending[:ready])
+                    pending = pending[ready:]
+            
+            # Le shell s'est terminé avant la sentinelle
+            if exit_status is None and channel.exit_status_ready() and not channel.recv_ready():
+                consume(pending)
+                pending = b""
+                exit_status = channel.recv_exit_status()
+                channel.close()
+                self.interactive_shell = None
+            
+            # Un seul flush par réveil de select(), pas un par bloc reçu
+            if echo:
+                sys.stdout.buffer.flush()
+        
+        return exit_status, output_head, watch_match
+    
+    @staticmethod
+    def _drain_sentinel_line(channel, rest):
+        """
+        Lit jusqu'à la fin de la ligne de la sentinelle puis écarte ce qui reste
+        disponible (invite du shell), pour que la commande suivante ne le lise pas
+        
+        Args:
+            channel: Canal du shell interactif
+            rest: Octets déjà reçus après la sentinelle
+        """
+        deadline = time.monotonic() + SHELL_DRAIN_TIMEOUT
+        while b"\n" not in rest and time.monotonic() < deadline:
+            if channel.exit_status_ready() and not channel.recv_ready():
+                return
+            select.select([channel], [], [], 0.1)
+            if channel.recv_ready():
+                rest += channel.recv(CHANNEL_RECV_SIZE)
+        
+        while channel.recv_ready():
+            channel.recv(CHANNEL_RECV_SIZE)
+    
     def exec_command(self, command):
         """Exécute une commande système simple"""
         if self.dry_run:
@@ -170,11 +412,30 @@ class SSHManager:
             
         try:
             self.logger.info("[COMMANDE] %s", command)
-            stdin, stdout, stderr = self.ssh.exec_command(command, timeout=300)
+            stdin, stdout, stderr = self.ssh.exec_command(command, timeout=EXEC_COMMAND_TIMEOUT)
+            channel = stdout.channel
             
-            output = stdout.read().decode().strip()
-            errors = stderr.read().decode().strip()
-            exit_status = stdout.channel.recv_exit_status()
+            # Vider stdout et stderr par blocs au fil de l'eau, décodage unique à la fin
+            # (lectures non bloquantes: le timeout du canal ne s'applique pas, d'où l'échéance)
+            deadline = time.monotonic() + EXEC_COMMAND_TIMEOUT
+            out_chunks = []
+            err_chunks = []
+            while True:
+                if time.monotonic() > deadline:
+                    channel.close()
+                    self.logger.error("[ERREUR] Commande interrompue après %ds: %s", EXEC_COMMAND_TIMEOUT, command)
+                    return False, "timeout"
+                select.select([channel], [], [], 1.0)
+                while channel.recv_ready():
+                    out_chunks.append(channel.recv(CHANNEL_RECV_SIZE))
+                while channel.recv_stderr_ready():
+                    err_chunks.append(channel.recv_stderr(CHANNEL_RECV_SIZE))
+                if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                    break
+            
+            output = b"".join(out_chunks).decode(errors='replace').strip()
+            errors = b"".join(err_chunks).decode(errors='replace').strip()
+            exit_status = channel.recv_exit_status()
             
             if exit_status == 0:
                 return True, output
@@ -202,31 +463,63 @@ class SSHManager:
             if local_path.is_file():
                 # Upload simple d'un fichier
                 self.logger.info("[UPLOAD] Fichier: %s → %s", local_path.name, remote_path)
-                self.sftp.put(str(local_path), remote_path)
+                self.put_file(self.sftp, str(local_path), remote_path)
                 return True
                 
             elif local_path.is_dir():
                 # Upload récursif d'un répertoire
                 self.logger.info("[UPLOAD] Répertoire: %s → %s", local_path.name, remote_path)
                 
-                # Créer le répertoire distant
-                self.exec_command(f"mkdir -p '{remote_path}'")
+                # Chemin rapide: archive tar en flux, extraite à la volée (pas de fichier temporaire)
+                if self.upload_items_as_tar(local_path, ["."], remote_path):
+                    return True
                 
-                # Parcourir et uploader tous les fichiers
-                for item in local_path.rglob('*'):
-                    if item.is_file():
-                        rel_path = item.relative_to(local_path)
-                        remote_item = f"{remote_path}/{rel_path}".replace('\\', '/')
-                        remote_dir = os.path.dirname(remote_item)
-                        
-                        # Créer le répertoire parent si nécessaire
-                        self.exec_command(f"mkdir -p '{remote_dir}'")
-                        
-                        # Upload du fichier
+                # Serveur sans tar: archive zip sur un seul canal
+                self.logger.warning("[ATTENTION] Envoi tar impossible, essai avec une archive zip")
+                if self.upload_dir_as_zip(local_path, remote_path):
+                    return True
+                
+                self.logger.warning("[ATTENTION] Envoi zip impossible, repli sur l'upload SFTP fichier par fichier")
+                
+                # Lister les fichiers une seule fois et précalculer les chemins distants:
+                # le répertoire distant est calculé une fois par répertoire, pas par fichier
+                files = []
+                remote_dirs = {remote_path}
+                local_root = str(local_path)
+                prefix_len = len(local_root) + 1
+                for dirpath, _, filenames in os.walk(local_root):
+                    rel_dir = dirpath[prefix_len:].replace(os.sep, '/')
+                    remote_dir = f"{remote_path}/{rel_dir}" if rel_dir else remote_path
+                    if filenames:
+                        remote_dirs.add(remote_dir)
+                    for filename in filenames:
+                        files.append((os.path.join(dirpath, filename), f"{remote_dir}/{filename}"))
+                
+                # Créer tous les répertoires distants en une seule commande
+                if not self.make_remote_dirs(remote_dirs):
+                    return False
+                
+                # Ignorer les fichiers déjà présents et identiques (reprise après interruption)
+                files = self.skip_uploaded_files(files)
+                if not files:
+                    self.logger.info("[UPLOAD] Tous les fichiers sont déjà à jour sur le serveur")
+                    return True
+                
+                # Uploader tous les fichiers en parallèle sur plusieurs clients SFTP
+                pool = self.get_sftp_pool()
+                # Taille totale du pool (qsize varie si d'autres threads empruntent des clients)
+                with ThreadPoolExecutor(max_workers=1 + len(self.extra_sftp_clients)) as executor:
+                    futures = {
+                        executor.submit(self._pooled_put, pool, item, remote_item): item
+                        for item, remote_item in files
+                    }
+                    for future in as_completed(futures):
                         try:
-                            self.sftp.put(str(item), remote_item)
+                            future.result()
                         except Exception as e:
-                            self.logger.error("[ERREUR] Erreur upload %s: %s", item, str(e))
+                            self.logger.error("[ERREUR] Erreur upload %s: %s", futures[future], str(e))
+                            for pending in futures:
+                                pending.cancel()
                             return False
                             
                 return True
@@ -238,6 +531,258 @@ class SSHManager:
             self.logger.error("[ERREUR] Erreur lors de l'upload: %s", str(e))
             return False
     
+    def skip_uploaded_files(self, files):
+        """
+        Retire les fichiers déjà présents sur le serveur avec la même taille et
+        la même date de modification
+        
+        Un seul listdir_attr par répertoire distant, comme la vérification rapide de rsync.
+        
+        Args:
+            files: Liste de tuples (chemin local, chemin distant)
+            
+        Returns:
+            Liste des tuples restant à envoyer
+        """
+        by_dir = {}
+        for item, remote_item in files:
+            by_dir.setdefault(os.path.dirname(remote_item), []).append((item, remote_item))
+        
+        to_upload = []
+        for remote_dir, group in by_dir.items():
+            try:
+                remote_attrs = {
+                    a.filename: (a.st_size, a.st_mtime)
+                    for a in self.sftp.listdir_attr(remote_dir)
+                }
+            except IOError:
+                remote_attrs = {}
+            
+            for item, remote_item in group:
+                # SFTP ne transmet que des secondes entières
+                local_stat = os.stat(item)
+                local_attrs = (local_stat.st_size, int(local_stat.st_mtime))
+                if remote_attrs.get(os.path.basename(remote_item)) == local_attrs:
+                    self.logger.debug("[UPLOAD] Déjà à jour: %s", remote_item)
+                else:
+                    to_upload.append((item, remote_item))
+        
+        skipped = len(files) - len(to_upload)
+        if skipped:
+            self.logger.info("[UPLOAD] %d fichier(s) déjà à jour ignoré(s)", skipped)
+        return to_upload
+    
+    def get_sftp_pool(self):
+        """
+        Retourne une file de clients SFTP partagée entre les threads d'upload
+        
+        Le client principal est toujours inclus; des clients supplémentaires sont
+        ouverts jusqu'à SFTP_POOL_SIZE, en s'arrêtant si le serveur refuse de
+        nouvelles sessions (MaxSessions).
+        """
+        # Plusieurs répertoires peuvent être envoyés en parallèle: une seule création
+        with self.sftp_pool_lock:
+            if self.sftp_pool is not None:
+                return self.sftp_pool
+            
+            pool = queue.Queue()
+            pool.put(self.sftp)
+            for _ in range(SFTP_POOL_SIZE - 1):
+                try:
+                    client = self.ssh.open_sftp()
+                except Exception as e:
+                    self.logger.warning("[ATTENTION] Client SFTP supplémentaire refusé, %d utilisé(s): %s",
+                                        pool.qsize(), str(e))
+                    break
+                self.extra_sftp_clients.append(client)
+                pool.put(client)
+            
+            self.sftp_pool = pool
+            return pool
+    
+    @staticmethod
+    def put_file(client, local_file, remote_file):
+        """
+        Upload un fichier en écriture pipelinée (sans attendre l'ACK de chaque bloc)
+        
+        Args:
+            client: Client SFTP à utiliser
+            local_file: Chemin du fichier local
+            remote_file: Chemin du fichier distant
+        """
+        with open(local_file, 'rb', buffering=LOCAL_IO_BUFFER) as src, \
+                client.open(remote_file, 'wb') as dst:
+            dst.set_pipelined(True)
+            # Blocs de 1 Mo côté Python; paramiko les découpe en requêtes SFTP de 32 Ko
+            shutil.copyfileobj(src, dst, LOCAL_IO_BUFFER)
+            # Conserver la date de modification (utilisée pour ignorer les fichiers à jour)
+            local_stat = os.fstat(src.fileno())
+            dst.utime((local_stat.st_atime, local_stat.st_mtime))
+    
+    @staticmethod
+    def _pooled_put(pool, local_file, remote_file):
+        """Upload un fichier avec un client SFTP emprunté à la file"""
+        client = pool.get()
+        try:
+            SSHManager.put_file(client, local_file, remote_file)
+        finally:
+            pool.put(client)
+    
+    def make_remote_dirs(self, remote_dirs):
+        """
+        Crée plusieurs répertoires distants avec un seul appel à mkdir -p
+        
+        Seules les feuilles de l'arborescence sont passées à mkdir -p (qui crée
+        les parents); en cas d'échec de la commande, repli sur sftp.mkdir du
+        plus court au plus long chemin.
+        
+        Args:
+            remote_dirs: Ensemble des chemins de répertoires distants
+        
+        Returns:
+            True si succès, False sinon
+        """
+        missing = set(d.rstrip('/') or '/' for d in remote_dirs) - self.created_dirs
+        if not missing:
+            return True
+        
+        # Ancêtres de chaque répertoire: créés implicitement par mkdir -p
+        ancestors = set()
+        for d in missing:
+            parent = posixpath.dirname(d)
+            while parent not in ancestors and parent not in ('', '/'):
+                ancestors.add(parent)
+                parent = posixpath.dirname(parent)
+        leaves = sorted(missing - ancestors)
+        
+        success, _ = self.exec_command("mkdir -p " + " ".join(shlex.quote(d) for d in leaves))
+        if not success:
+            self.logger.warning("[ATTENTION] mkdir -p impossible, création via SFTP")
+            try:
+                for d in sorted(missing | ancestors, key=len):
+                    try:
+                        self.sftp.mkdir(d)
+                    except IOError:
+                        # Déjà existant: une vraie erreur ressortira à l'upload
+                        pass
+                success = True
+            except Exception as e:
+                self.logger.error("[ERREUR] Création des répertoires distants: %s", str(e))
+                return False
+        
+        self.created_dirs.update(missing, ancestors)
+        return success
+    
+    def upload_items_as_tar(self, local_base, items, remote_path):
+        """
+        Envoie plusieurs fichiers/répertoires dans une seule archive tar en flux,
+        extraite à la volée par tar côté serveur
+        
+        Un seul canal SSH est utilisé pour tout le transfert: il n'y a aucun
+        aller-retour SFTP par fichier.
+        
+        Args:
+            local_base: Répertoire local contenant les items (Path)
+            items: Noms des items à envoyer, relatifs à local_base
+            remote_path: Répertoire distant de destination
+        
+        Returns:
+            True si succès, False sinon
+        """
+        if self.dry_run:
+            self.logger.info("[SIMULATION] Upload tar %s → %s", ", ".join(items), remote_path)
+            return True
+        
+        if not self.ssh:
+            self.logger.error("[ERREUR] Aucune connexion SSH active")
+            return False
+        
+        channel = None
+        try:
+            self.logger.info("[UPLOAD] Archive tar: %s → %s", ", ".join(items), remote_path)
+            remote_dir = shlex.quote(remote_path)
+            
+            channel = self.ssh.get_transport().open_session()
+            channel.exec_command(f"mkdir -p {remote_dir} && tar -xf - -C {remote_dir}")
+            
+            # Blocs de 1 Mo: le tampon par défaut (10 Ko) multiplie les sendall
+            with tarfile.open(fileobj=_ChannelWriter(channel), mode='w|',
+                              bufsize=LOCAL_IO_BUFFER) as tar:
+                for item in items:
+                    tar.add(str(local_base / item), arcname=item)
+            
+            channel.shutdown_write()
+            exit_status = channel.recv_exit_status()
+            
+            if exit_status != 0:
+                errors = channel.recv_stderr(4096).decode(errors='replace').strip()
+                self.logger.error("[ERREUR] Extraction tar échouée (code %d): %s", exit_status, errors)
+                return False
+            
+            return True
+            
+        except Exception as e:
+            self.logger.error("[ERREUR] Erreur lors de l'envoi tar: %s", str(e))
+            return False
+        finally:
+            if channel is not None:
+                channel.close()
+    
+    def upload_dir_as_zip(self, local_path, remote_path):
+        """
+        Envoie un répertoire sous forme d'archive zip (sans compression) via une seule
+        commande SSH, puis l'extrait côté serveur
+        
+        Les JPEG étant déjà compressés, le mode ZIP_STORED évite un coût CPU inutile.
+        L'archive est écrite dans un fichier temporaire distant car unzip ne sait pas
+        lire depuis l'entrée standard.
+        
+        Args:
+            local_path: Répertoire local (Path)
+            remote_path: Répertoire distant de destination
+        
+        Returns:
+            True si succès, False sinon
+        """
+        if not self.ssh:
+            return False
+        
+        channel = None
+        try:
+            remote_dir = shlex.quote(remote_path)
+            remote_cmd = (
+                "tmp=$(mktemp) && "
+                f"mkdir -p {remote_dir} && "
+                "cat > \"$tmp\" && "
+                f"unzip -o -q \"$tmp\" -d {remote_dir}; "
+                "rc=$?; rm -f \"$tmp\"; exit $rc"
+            )
+            
+            channel = self.ssh.get_transport().open_session()
+            channel.exec_command(remote_cmd)
+            
+            with zipfile.ZipFile(_ChannelWriter(channel), 'w', zipfile.ZIP_STORED) as zf:
+                for item in local_path.rglob('*'):
+                    if item.is_file():
+                        zf.write(item, item.relative_to(local_path).as_posix())
+            
+            channel.shutdown_write()
+            exit_status = channel.recv_exit_status()
+            
+            if exit_status != 0:
+                errors = channel.recv_stderr(4096).decode(errors='replace').strip()
+                self.logger.error("[ERREUR] Extraction zip échouée (code %d): %s", exit_status, errors)
+                return False
+            
+            return True
+            
+        except Exception as e:
+            self.logger.error("[ERREUR] Erreur lors de l'envoi zip: %s", str(e))
+            return False
+        finally:
+            if channel is not None:
+                channel.close()
+    
     def download_file(self, remote_path, local_path):
         """Télécharge un fichier du serveur"""
         if self.dry_run:
@@ -254,24 +799,120 @@ class SSHManager:
             os.makedirs(local_dir, exist_ok=True)
             
             self.logger.info("[TÉLÉCHARGEMENT] %s → %s", remote_path, local_path)
-            self.sftp.get(remote_path, local_path)
+            
+            # Chemin rapide: flux compressé par gzip côté serveur
+            if self.download_file_gzip(remote_path, local_path):
+                return True
+            
+            self.logger.warning("[ATTENTION] Téléchargement compressé impossible, repli sur SFTP")
+            with self.sftp.open(remote_path, 'rb') as rf, \
+                    open(local_path, 'wb', buffering=LOCAL_IO_BUFFER) as f:
+                # Toutes les requêtes de lecture sont émises d'avance, taille connue
+                file_size = rf.stat().st_size
+                try:
+                    rf.prefetch(file_size, SFTP_PREFETCH_REQUESTS)
+                except TypeError:
+                    # paramiko < 3.3 ne connaît pas max_concurrent_requests
+                    rf.prefetch(file_size)
+                shutil.copyfileobj(rf, f, LOCAL_IO_BUFFER)
             return True
         except Exception as e:
             self.logger.error("[ERREUR] Erreur téléchargement: %s", str(e))
             return False
     
+    def download_file_gzip(self, remote_path, local_path):
+        """
+        Télécharge un fichier compressé à la volée par gzip côté serveur et le
+        décompresse en flux côté local
+        
+        Les nuages de points PLY se compressent bien (3 à 5x), ce qui réduit
+        d'autant le volume transféré.
+        
+        Args:
+            remote_path: Chemin du fichier distant
+            local_path: Chemin du fichier local
+        
+        Returns:
+            True si succès, False sinon
+        """
+        channel = None
+        try:
+            channel = self.ssh.get_transport().open_session()
+            channel.exec_command(f"gzip -c {shlex.quote(remote_path)}")
+            
+            # 16 + MAX_WBITS: format gzip (en-tête et CRC)
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            with open(local_path, 'wb', buffering=LOCAL_IO_BUFFER) as f:
+                while True:
+                    data = channel.recv(CHANNEL_RECV_SIZE)
+                    if not data:
+                        break
+                    f.write(decompressor.decompress(data))
+                f.write(decompressor.flush())
+            
+            exit_status = channel.recv_exit_status()
+            if exit_status != 0 or not decompressor.eof:
+                self.logger.error("[ERREUR] Flux gzip invalide (code %d)", exit_status)
+                os.remove(local_path)
+                return False
+            
+            return True
+            
+        except Exception as e:
+            self.logger.error("[ERREUR] Erreur téléchargement compressé: %s", str(e))
+            if os.path.exists(local_path):
+                os.remove(local_path)
+            return False
+        finally:
+            if channel is not None:
+                channel.close()
+    
+    def find_latest_remote_dir(self, remote_path, prefix):
+        """
+        Trouve le sous-répertoire distant le plus récent commençant par prefix
+        (un seul listdir_attr SFTP, sans lancer de shell distant)
+        
+        Args:
+            remote_path: Répertoire distant à parcourir
+            prefix: Préfixe du nom recherché
+            
+        Returns:
+            Chemin du répertoire trouvé, ou None
+        """
+        if self.dry_run:
+            self.logger.info("[SIMULATION] Recherche de %s* dans %s", prefix, remote_path)
+            return f"{remote_path.rstrip('/')}/{prefix}"
+        
+        try:
+            candidates = [
+                entry for entry in self.sftp.listdir_attr(remote_path)
+                if entry.filename.startswith(prefix) and stat.S_ISDIR(entry.st_mode)
+            ]
+        except IOError as e:
+            self.logger.error("[ERREUR] Impossible de lister %s: %s", remote_path, str(e))
+            return None
+        
+        if not candidates:
+            return None
+        
+        latest = max(candidates, key=lambda entry: entry.st_mtime)
+        return f"{remote_path.rstrip('/')}/{latest.filename}"
+    
     def check_and_handle_lock(self):
         """Vérifie s'il y a un verrou et propose de le supprimer"""
         if self.dry_run:
             return "continue"
             
-        # Vérifier l'existence du fichier de verrou
-        lock_file = "/mnt/diskSustainability/Scanner_Data/scanner_lyon/3dt_colA/lock"
-        check_cmd = f"test -f '{lock_file}'"
-        success, _ = self.exec_command(check_cmd)
+        # Vérifier l'existence du fichier de verrou par un simple stat SFTP
+        # (pas de shell distant lancé pour un test -f)
+        try:
+            self.sftp.stat(LOCK_FILE)
+            lock_exists = True
+        except IOError:
+            lock_exists = False
         
-        if success:  # Le fichier existe (test -f retourne 0 si le fichier existe)
-            self.logger.warning("🔒 Fichier de verrou détecté: %s", lock_file)
+        if lock_exists:
+            self.logger.warning("🔒 Fichier de verrou détecté: %s", LOCK_FILE)
             return handle_lock_removal(self)  # Retourne "exit_script" ou autre
         else:
             # Pas de verrou, on peut continuer
@@ -279,10 +920,18 @@ class SSHManager:
     
     def close(self):
         """Ferme les connexions"""
+        if self.interactive_shell is not None:
+            self.interactive_shell.close()
+            self.interactive_shell = None
+        for client in self.extra_sftp_clients:
+            client.close()
+        self.extra_sftp_clients = []
+        self.sftp_pool = None
         if self.sftp:
             self.sftp.close()
         if self.ssh:
             self.ssh.close()
+        self.created_dirs.clear()
         self.logger.info("🔌 Connexions fermées")
 
 
@@ -303,9 +952,11 @@ def handle_lock_removal(ssh_manager):
             response = input("\nVoulez-vous supprimer le verrou ? (oui/non): ").strip().lower()
             if response in ['oui', 'o', 'yes', 'y']:
                 # Supprimer le verrou
-                lock_file = "/mnt/diskSustainability/Scanner_Data/scanner_lyon/3dt_colA/lock"
-                unlock_cmd = f"rm -f '{lock_file}'"
-                success, _ = ssh_manager.exec_command(unlock_cmd)
+                try:
+                    ssh_manager.sftp.remove(LOCK_FILE)
+                    success = True
+                except IOError:
+                    success = False
                 
                 if success:
                     print("\n[SUCCÈS] Verrou supprimé avec succès")
@@ -10,6 +10,7 @@ import sys
 import argparse
 import numpy as np
 import time
+import traceback
 
 # Importations des modules de la nouvelle architecture
 from core.hardware.cnc_controller import CNCController
@@ -20,7 +21,7 @@ from core.utils import config
 
 # Importations des modules spécifiques au ciblage
 from targeting.modules.data_manager import load_and_scale_pointcloud, compute_cropped_alpha_shape, save_leaves_data
-from targeting.modules.leaf_analyzer import calculate_adaptive_radius, build_connectivity_graph
+from targeting.modules.leaf_analyzer import calculate_adaptive_radius, build_connectivity_graph, build_point_tree
 from targeting.modules.leaf_analyzer import detect_communities_louvain_multiple, extract_leaf_data_from_communities
 from targeting.modules.interactive_selector import select_leaf_with_matplotlib
 from targeting.modules.path_planner import plan_safe_path, plan_complete_path
@@ -45,9 +46,16 @@ class LeafTargeting:
         self.crop_percentage = 0.25
         self.z_offset = 0.0
         self.arduino_port = config.ARDUINO_PORT
+        # Paramètres de trajectoire et du CNC, lus une seule fois dans la configuration
+        self.center_point = config.CENTER_POINT
+        self.circle_radius = config.CIRCLE_RADIUS
+        self.num_positions = config.NUM_POSITIONS
+        self.stabilization_time = config.STABILIZATION_TIME
+        self.cnc_speed = config.CNC_SPEED
         self.simulate = False
         self.auto_photo = False
         self.louvain_coeff = 0.5
+        self.leiden = False
         self.distance = 0.4  # Distance par défaut aux feuilles cibles modifiée à 40 cm
         
         # Mettre à jour les paramètres avec les arguments de la ligne de commande
@@ -106,6 +114,9 @@ class LeafTargeting:
         
         if hasattr(args, 'louvain_coeff') and args.louvain_coeff is not None:
             self.louvain_coeff = args.louvain_coeff
+        
+        if hasattr(args, 'leiden') and args.leiden is not None:
+            self.leiden = args.leiden
             
         if hasattr(args, 'distance') and args.distance is not None:
             self.distance = args.distance
@@ -137,7 +148,7 @@ class LeafTargeting:
             
             # Initialiser les contrôleurs matériels (uniquement si pas en mode simulation)
             if not self.simulate:
-                self.cnc = CNCController(config.CNC_SPEED)
+                self.cnc = CNCController(self.cnc_speed)
                 self.cnc.connect()
                 
                 self.camera = CameraController()
@@ -191,7 +202,9 @@ class LeafTargeting:
             
             # 3. Calculer le rayon de connectivité
             print("\n=== 3. Calcul du rayon de connectivité ===")
-            radius = calculate_adaptive_radius(self.alpha_points)
+            # Un seul KDTree pour le rayon et le graphe
+            alpha_tree = build_point_tree(self.alpha_points)
+            radius = calculate_adaptive_radius(self.alpha_points, tree=alpha_tree)
             
             # 4. Coefficient Louvain fourni par l'utilisateur
             print(f"\n=== 4. Coefficient Louvain: {self.louvain_coeff} ===")
@@ -199,7 +212,7 @@ class LeafTargeting:
             
             # 5. Construire le graphe de connectivité
             print("\n=== 5. Construction du graphe de connectivité ===")
-            graph = build_connectivity_graph(self.alpha_points, radius)
+            graph = build_connectivity_graph(self.alpha_points, radius, tree=alpha_tree)
             
             # 6. Déterminer la taille minimale des communautés
             min_size = max(10, len(self.alpha_points) // 30)
@@ -207,7 +220,8 @@ class LeafTargeting:
             
             # 7. Détecter les communautés avec Louvain
             print("\n=== 7. Détection des communautés ===")
-            communities = detect_communities_louvain_multiple(graph, coeff, min_size, n_iterations=5)
+            communities = detect_communities_louvain_multiple(graph, coeff, min_size, n_iterations=5,
+                                                              use_leiden=self.leiden)
             
             # 8. Extraire les données des feuilles
             print("\n=== 8. Extraction des données des feuilles ===")
@@ -238,33 +252,31 @@ class LeafTargeting:
                 pos = self.cnc.get_position()
                 current_position = [pos['x'], pos['y'], pos['z']]
             
-            # Extraire les points cibles
-            target_points = [leaf["target_point"] for leaf in self.selected_leaves]
+            # Un seul passage sur les feuilles sélectionnées: cibles, centroïdes, IDs
+            # et données de visualisation
+            target_points = []
+            leaf_centroids = []
+            leaf_ids = []
+            leaf_points_list = []
+            leaf_normals_list = []
+            
+            # np.asarray: pas de copie quand la donnée est déjà un tableau float
+            for leaf in self.selected_leaves:
+                target_points.append(leaf["target_point"])
+                leaf_centroids.append(leaf['centroid'])
+                leaf_ids.append(leaf['id'])
+                leaf_points_list.append(np.asarray(leaf.get('points', [leaf['centroid']]), dtype=float))
+                leaf_normals_list.append(np.asarray(leaf.get('normal', [0, 0, 1]), dtype=float))
             
             # Planifier la trajectoire complète - la distance est déjà prise en compte dans les target_points
             complete_path = plan_complete_path(
-                current_position, target_points, config.CENTER_POINT, config.CIRCLE_RADIUS, 
-                config.NUM_POSITIONS
+                current_position, target_points, self.center_point, self.circle_radius, 
+                self.num_positions
             )
             
             # 11. Visualiser la trajectoire complète
             print("\n=== 11. Visualisation de la trajectoire complète ===")
             
-            # Préparer les données des feuilles sélectionnées pour la visualisation
-            leaf_points_list = []
-            leaf_normals_list = []
-            
-            for leaf in self.selected_leaves:
-                if 'points' in leaf:
-                    leaf_points_list.append(np.array(leaf['points']))
-                else:
-                    leaf_points_list.append(np.array([leaf['centroid']]))
-                
-                if 'normal' in leaf:
-                    leaf_normals_list.append(np.array(leaf['normal']))
-                else:
-                    leaf_normals_list.append(np.array([0, 0, 1]))
-            
             # Visualiser la trajectoire complète
             visualize_complete_path(
                 complete_path, self.points, leaf_points_list, leaf_normals_list, 
@@ -279,17 +291,13 @@ class LeafTargeting:
             # 12. Exécuter la trajectoire
             print("\n=== 12. Exécution de la trajectoire ===")
             
-            # Récupérer les centroïdes des feuilles et leurs IDs
-            leaf_centroids = [leaf['centroid'] for leaf in self.selected_leaves]
-            leaf_ids = [leaf['id'] for leaf in self.selected_leaves]
-            
             # Exécuter la trajectoire complète
             success = self.robot.execute_path(
                 complete_path,
                 leaf_centroids=leaf_centroids,
                 leaf_ids=leaf_ids,
                 auto_photo=self.auto_photo,
-                stabilization_time=config.STABILIZATION_TIME
+                stabilization_time=self.stabilization_time
             )
             
             if success:
@@ -304,7 +312,6 @@ class LeafTargeting:
             return False
         except Exception as e:
             print(f"\nUne erreur est survenue: {e}")
-            import traceback
             traceback.print_exc()
             return False
         finally:
@@ -346,6 +353,7 @@ def parse_arguments():
     parser.add_argument('--simulate', action='store_true', help='Mode simulation (sans contrôle robot)')
     parser.add_argument('--auto_photo', action='store_true', help='Prendre automatiquement des photos à chaque cible')
     parser.add_argument('--louvain_coeff', type=float, default=0.5, help='Coefficient pour la détection Louvain (défaut: 0.5)')
+    parser.add_argument('--leiden', action='store_true', help='Détecter les communautés avec Leiden au lieu de Louvain (nécessite leidenalg)')
     parser.add_argument('--distance', type=float, default=0.04, help='Distance aux feuilles cibles en mètres (défaut: 0.4 m)')
     
     return parser.parse_args()
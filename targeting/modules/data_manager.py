@@ -4,8 +4,26 @@ import json
 import numpy as np
 import open3d as o3d
 import time
+import hashlib
 from datetime import datetime
-from scipy.spatial import cKDTree
+from scipy.spatial import cKDTree, Delaunay
+
+from core.utils import config
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Champs volumineux non sauvegardés dans le JSON des feuilles
+_LEAF_EXCLUDED_FIELDS = ('points', 'points_indices')
+# Répertoires déjà créés par ce module (évite de refaire stat/mkdir à chaque écriture)
+_ensured_dirs = set()
+# Les 4 faces triangulaires d'un tétraèdre (indices de sommets locaux)
+_TETRA_FACES = np.array([[0, 1, 2], [0, 1, 3], [0, 2, 3], [1, 2, 3]])
+# Sous-répertoire de RESULTS_DIR contenant les caches des nuages mis à l'échelle
+POINTS_CACHE_DIR = "cache"
 
 def load_and_scale_pointcloud(file_path, scale_factor=0.001):
     """
@@ -19,15 +37,32 @@ def load_and_scale_pointcloud(file_path, scale_factor=0.001):
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"Le fichier {file_path} n'existe pas.")
         
-        # Charger le nuage avec Open3D
-        pcd = o3d.io.read_point_cloud(file_path)
-        points = np.asarray(pcd.points) * scale_factor
-        pcd.points = o3d.utility.Vector3dVector(points)
+        # Cache binaire du nuage mis à l'échelle (points, couleurs, normales) sous RESULTS_DIR
+        cache_path = points_cache_path(file_path, scale_factor)
+        
+        if (os.path.exists(cache_path)
+                and os.path.getmtime(cache_path) >= os.path.getmtime(file_path)):
+            # Lecture binaire directe: ni analyse du PLY ni mise à l'échelle
+            pcd = o3d.geometry.PointCloud()
+            with np.load(cache_path) as cached:
+                pcd.points = o3d.utility.Vector3dVector(cached['points'])
+                if 'colors' in cached:
+                    pcd.colors = o3d.utility.Vector3dVector(cached['colors'])
+                if 'normals' in cached:
+                    pcd.normals = o3d.utility.Vector3dVector(cached['normals'])
+            points = np.asarray(pcd.points)
+            print(f"Nuage lu depuis le cache {cache_path}")
+        else:
+            # Charger le nuage avec Open3D
+            pcd = o3d.io.read_point_cloud(file_path)
+            # np.asarray partage le tampon d'Open3D: la mise à l'échelle en place
+            # met aussi à jour pcd.points, sans copie ni nouveau Vector3dVector
+            points = np.asarray(pcd.points)
+            np.multiply(points, scale_factor, out=points)
+            save_points_cache(pcd, cache_path)
         
         print(f"Nuage chargé: {len(points)} points, échelle: {scale_factor}")
-        min_bound = np.min(points, axis=0)
-        max_bound = np.max(points, axis=0)
-        size = max_bound - min_bound
+        size = np.ptp(points, axis=0)
         print(f"Dimensions: {size[0]:.3f} x {size[1]:.3f} x {size[2]:.3f} m")
         
         return pcd, points
@@ -36,13 +71,66 @@ def load_and_scale_pointcloud(file_path, scale_factor=0.001):
         print(f"ERREUR: {e}")
         raise
 
-def apply_cropping_method(points, crop_method='single_furthest', crop_percentage=0.25, z_offset=0.0):
+def _ensure_dir(path):
+    """Crée un répertoire (et ses parents) une seule fois par processus"""
+    if path and path not in _ensured_dirs:
+        os.makedirs(path, exist_ok=True)
+        _ensured_dirs.add(path)
+
+def points_cache_path(file_path, scale_factor):
+    """
+    Chemin du cache d'un nuage mis à l'échelle
+    
+    Le nom combine le nom du fichier source et une empreinte de son chemin absolu,
+    pour que deux nuages homonymes de dossiers différents ne partagent pas de cache.
+    
+    Args:
+        file_path: Chemin du fichier PLY source
+        scale_factor: Facteur d'échelle appliqué aux points
+        
+    Returns:
+        Chemin du fichier .npz sous RESULTS_DIR/cache
+    """
+    digest = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:12]
+    name = f"{os.path.basename(file_path)}.{digest}.s{scale_factor}.npz"
+    return os.path.join(config.RESULTS_DIR, POINTS_CACHE_DIR, name)
+
+def save_points_cache(pcd, cache_path):
+    """
+    Sauvegarde le nuage dans un cache .npz (écriture atomique)
+    
+    Les couleurs et normales sont conservées lorsque le nuage en possède.
+    Un échec (répertoire en lecture seule, disque plein) n'est pas bloquant.
+    """
+    arrays = {'points': np.asarray(pcd.points)}
+    if pcd.has_colors():
+        arrays['colors'] = np.asarray(pcd.colors)
+    if pcd.has_normals():
+        arrays['normals'] = np.asarray(pcd.normals)
+    
+    tmp_path = f"{cache_path}.tmp"
+    try:
+        _ensure_dir(os.path.dirname(cache_path))
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Cache du nuage non écrit: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def apply_cropping_method(points, crop_method='single_furthest', crop_percentage=0.25, z_offset=0.0,
+                          z_bounds=None):
     """
     Applique la méthode de cropping choisie
     Adapté de alpha_louvain_interactive.py
+    
+    z_bounds: (min_z, max_z) déjà calculés par l'appelant (optionnel)
     """
-    z_values = points[:, 2]
-    min_z, max_z = np.min(z_values), np.max(z_values)
+    if z_bounds is None:
+        z_values = points[:, 2]
+        z_bounds = (np.min(z_values), np.max(z_values))
+    min_z, max_z = z_bounds
     
     if crop_method == 'none':
         # Pas de cropping - prendre le minimum de Z (tous les points)
@@ -57,47 +145,91 @@ def apply_cropping_method(points, crop_method='single_furthest', crop_percentage
         # Méthode du point le plus éloigné unique
         xy_points = points[:, :2]
         xy_center = np.mean(xy_points, axis=0)
-        distances = np.sqrt(np.sum((xy_points - xy_center)**2, axis=1))
-        furthest_idx = np.argmax(distances)
+        # Distances au carré: même argmax, sans racine ni tableau temporaire des carrés
+        diff = xy_points - xy_center
+        furthest_idx = np.argmax(np.einsum('ij,ij->i', diff, diff))
         furthest_point_z = points[furthest_idx, 2]
         z_threshold = furthest_point_z - z_offset
     
     return z_threshold
 
+def compute_alpha_shape_vertices(points, alpha_value):
+    """
+    Calcule les sommets de l'alpha shape 3D sans construire de TriangleMesh
+    
+    Même principe qu'Open3D: tétraèdres de Delaunay de rayon circonscrit <= alpha,
+    puis faces appartenant à un seul tétraèdre retenu (le bord). Seuls les
+    sommets de ces faces sont renvoyés, dans l'ordre du nuage d'entrée.
+    
+    Args:
+        points: Tableau (N, 3) des points
+        alpha_value: Rayon alpha
+        
+    Returns:
+        Tableau (M, 3) des sommets de l'alpha shape
+    """
+    tetras = Delaunay(points).simplices
+    
+    # Rayon circonscrit de chaque tétraèdre (a, b, c, d), formule fermée vectorisée
+    a = points[tetras[:, 0]]
+    u = points[tetras[:, 1]] - a
+    v = points[tetras[:, 2]] - a
+    w = points[tetras[:, 3]] - a
+    vw = np.cross(v, w)
+    numerator = (np.einsum('ij,ij->i', u, u)[:, None] * vw
+                 + np.einsum('ij,ij->i', v, v)[:, None] * np.cross(w, u)
+                 + np.einsum('ij,ij->i', w, w)[:, None] * np.cross(u, v))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Tétraèdres plats: volume nul, rayon infini (jamais retenus)
+        center_offset = numerator / (2.0 * np.einsum('ij,ij->i', u, vw))[:, None]
+        radii = np.linalg.norm(center_offset, axis=1)
+    kept = tetras[radii <= alpha_value]
+    
+    if len(kept) == 0:
+        return np.empty((0, 3))
+    
+    # Faces de bord: présentes une seule fois parmi les tétraèdres retenus
+    faces = np.sort(kept[:, _TETRA_FACES].reshape(-1, 3), axis=1)
+    unique_faces, counts = np.unique(faces, axis=0, return_counts=True)
+    boundary_vertices = np.unique(unique_faces[counts == 1])
+    
+    return points[boundary_vertices]
+
 def compute_cropped_alpha_shape(pcd, points, alpha_value=0.1, crop_method='single_furthest', 
                               crop_percentage=0.25, z_offset=0.0, output_dir=None):
     """
     Calcule l'alpha shape croppé
     Adapté de alpha_louvain_interactive.py
     """
+    # Bornes en Z calculées une seule fois (cropping et re-cropping)
+    z_values = points[:, 2]
+    z_min, z_max = np.min(z_values), np.max(z_values)
+    
     # Appliquer le cropping
-    z_threshold = apply_cropping_method(points, crop_method, crop_percentage, z_offset)
+    z_threshold = apply_cropping_method(points, crop_method, crop_percentage, z_offset,
+                                        z_bounds=(z_min, z_max))
     
-    # Cropper les points
-    mask = points[:, 2] >= z_threshold
-    cropped_points = points[mask]
+    # Cropper les points (sans masque ni copie quand tous les points sont conservés)
+    if z_threshold <= z_min:
+        cropped_points = points
+    else:
+        cropped_points = points[z_values >= z_threshold]
     n_cropped = len(cropped_points)
     
     print(f"Points après cropping: {n_cropped} ({n_cropped/len(points)*100:.1f}%)")
     print(f"Seuil Z: {z_threshold:.4f} m")
     
-    # Créer le nuage croppé
-    cropped_pcd = o3d.geometry.PointCloud()
-    cropped_pcd.points = o3d.utility.Vector3dVector(cropped_points)
-    
-    # Calculer l'Alpha Shape
+    # Calculer l'Alpha Shape (seuls les sommets sont utilisés: pas de TriangleMesh)
     print(f"Calcul Alpha Shape: alpha = {alpha_value}")
     start_time = time.time()
     
     try:
-        mesh = o3d.geometry.TriangleMesh.create_from_point_cloud_alpha_shape(cropped_pcd, alpha_value)
-        alpha_points = np.asarray(mesh.vertices)
+        alpha_points = compute_alpha_shape_vertices(cropped_points, alpha_value)
         
         print(f"Alpha Shape calculé en {time.time() - start_time:.2f}s")
         print(f"Points Alpha: {len(alpha_points)} ({len(alpha_points)/n_cropped*100:.1f}%)")
         
         # Re-cropping léger pour éliminer les résidus
-        z_min, z_max = np.min(points[:, 2]), np.max(points[:, 2])
         z_range = z_max - z_min
         recrop_offset = 0.005 * z_range
         recrop_threshold = z_threshold + recrop_offset
@@ -109,47 +241,56 @@ def compute_cropped_alpha_shape(pcd, points, alpha_value=0.1, crop_method='singl
         print(f"Re-cropping: offset de {recrop_offset:.4f} m")
         print(f"Points final: {len(alpha_points)}")
         
-        # Créer le nuage de points final
-        alpha_pcd = o3d.geometry.PointCloud()
-        alpha_pcd.points = o3d.utility.Vector3dVector(alpha_points)
+        # Créer le nuage de points final (API tensorielle: partage le tampon
+        # numpy au lieu de le recopier dans un Vector3dVector)
+        alpha_points = np.ascontiguousarray(alpha_points)
+        alpha_pcd = o3d.t.geometry.PointCloud(o3d.core.Tensor.from_numpy(alpha_points))
         
         # Sauvegarder l'Alpha Shape si un répertoire est spécifié
         if output_dir:
-            os.makedirs(output_dir, exist_ok=True)
+            _ensure_dir(output_dir)
             alpha_output = os.path.join(output_dir, f"alpha_shape_{alpha_value:.3f}.ply")
-            o3d.io.write_point_cloud(alpha_output, alpha_pcd)
+            # PLY binaire (explicite): pas de formatage texte de chaque coordonnée
+            o3d.t.io.write_point_cloud(alpha_output, alpha_pcd, write_ascii=False)
             print(f"Alpha Shape sauvegardé: {alpha_output}")
-        
-        return alpha_pcd, alpha_points
+
+        # Les appelants attendent un o3d.geometry.PointCloud (API legacy)
+        return alpha_pcd.to_legacy(), alpha_points
         
     except Exception as e:
         print(f"ERREUR lors du calcul de l'Alpha Shape: {e}")
         raise
 
+def _json_numpy_default(obj):
+    """Convertit les tableaux et scalaires numpy pour json (repli sans orjson)"""
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    raise TypeError(f"Type non sérialisable en JSON: {type(obj).__name__}")
+
 def save_leaves_data(leaves_data, output_file):
     """Sauvegarde les données des feuilles au format JSON"""
     try:
         # Créer le répertoire si nécessaire
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        _ensure_dir(os.path.dirname(output_file))
         
         # Pour chaque feuille, filtrer les champs pour ne pas inclure les points complets
-        # (qui peuvent être très volumineux)
-        leaves_to_save = []
-        for leaf in leaves_data:
-            # Créer une copie sans les points complets
-            leaf_copy = leaf.copy()
-            
-            # Supprimer les champs volumineux
-            if 'points' in leaf_copy:
-                del leaf_copy['points']
-            if 'points_indices' in leaf_copy:
-                del leaf_copy['points_indices']
-            
-            leaves_to_save.append(leaf_copy)
+        # (qui peuvent être très volumineux): un seul dictionnaire par feuille
+        leaves_to_save = [
+            {key: value for key, value in leaf.items() if key not in _LEAF_EXCLUDED_FIELDS}
+            for leaf in leaves_data
+        ]
         
-        with open(output_file, 'w') as f:
-            # Formater avec indentation pour lisibilité
-            json.dump({"leaves": leaves_to_save}, f, indent=2)
+        if ORJSON_AVAILABLE:
+            # Sérialisation en C, tableaux numpy convertis directement
+            with open(output_file, 'wb') as f:
+                f.write(orjson.dumps(
+                    {"leaves": leaves_to_save},
+                    option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY
+                ))
+        else:
+            with open(output_file, 'w') as f:
+                # Formater avec indentation pour lisibilité
+                json.dump({"leaves": leaves_to_save}, f, indent=2, default=_json_numpy_default)
             
         print(f"Données sauvegardées dans {output_file}")
         return True
@@ -178,9 +319,6 @@ def create_output_directory():
     # Répertoire parent
     parent_dir = "leaf_targeting_results"
     
-    # S'assurer que le répertoire parent existe
-    os.makedirs(parent_dir, exist_ok=True)
-    
     # Créer un sous-répertoire avec la date et l'heure actuelles
     timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
     output_dir = os.path.join(parent_dir, f"leaf_targeting_{timestamp}")
@@ -190,10 +328,9 @@ def create_output_directory():
     analysis_dir = os.path.join(output_dir, "analysis")
     visualization_dir = os.path.join(output_dir, "visualizations")
     
-    os.makedirs(output_dir, exist_ok=True)
-    os.makedirs(images_dir, exist_ok=True)
-    os.makedirs(analysis_dir, exist_ok=True)
-    os.makedirs(visualization_dir, exist_ok=True)
+    # Seuls les répertoires feuilles: makedirs crée les parents au passage
+    for leaf_dir in (images_dir, analysis_dir, visualization_dir):
+        _ensure_dir(leaf_dir)
     
     print(f"Répertoire créé pour les résultats: {output_dir}")
     print(f"Sous-répertoires créés: images/, analysis/, visualizations/")
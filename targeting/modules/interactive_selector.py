@@ -1,30 +1,39 @@
 # modules/interactive_selector.py
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-import os
+from functools import lru_cache
+from targeting.modules.visualization import sample_points, _make_3d_fig, _configure_axes, _save_and_close
 
+@lru_cache(maxsize=32)
 def generate_distinct_colors(n):
-    """Génère n couleurs distinctes"""
-    colors = []
-    for i in range(n):
-        hue = i / n
-        saturation = 0.7 + 0.3 * (i % 2)
-        value = 0.8 + 0.2 * (i % 3)
-        
-        # Convertir HSV en RGB en utilisant colorsys (plus sûr)
-        import colorsys
-        r, g, b = colorsys.hsv_to_rgb(hue, saturation, value)
-        
-        # S'assurer que les valeurs sont dans [0, 1]
-        r = max(0.0, min(1.0, r))
-        g = max(0.0, min(1.0, g))
-        b = max(0.0, min(1.0, b))
-            
-        colors.append([r, g, b])
-    return colors
+    """
+    Génère n couleurs distinctes
+    
+    Conversion HSV → RGB vectorisée (mêmes formules que colorsys.hsv_to_rgb).
+    
+    Returns:
+        Tuple de n tuples (r, g, b) dans [0, 1] (immuable: le résultat est mis en cache)
+    """
+    i = np.arange(n)
+    hue = i / max(n, 1)
+    saturation = 0.7 + 0.3 * (i % 2)
+    value = 0.8 + 0.2 * (i % 3)
+    
+    sector = (hue * 6.0).astype(int)
+    f = hue * 6.0 - sector
+    p = value * (1.0 - saturation)
+    q = value * (1.0 - saturation * f)
+    t = value * (1.0 - saturation * (1.0 - f))
+    sector %= 6
+    
+    r = np.choose(sector, [value, q, p, p, t, value])
+    g = np.choose(sector, [t, value, value, q, p, p])
+    b = np.choose(sector, [p, p, t, value, value, q])
+    
+    # S'assurer que les valeurs sont dans [0, 1] (value peut dépasser 1)
+    rgb = np.clip(np.stack([r, g, b], axis=1), 0.0, 1.0)
+    return tuple(map(tuple, rgb.tolist()))
 
-def select_leaf_with_matplotlib(leaves_data, cloud_points, output_dir=None):
+def select_leaf_with_matplotlib(leaves_data, cloud_points, output_dir=None, dpi=150):
     """
     Affiche les feuilles numérotées et permet la sélection multiple via terminal
     
@@ -32,6 +41,7 @@ def select_leaf_with_matplotlib(leaves_data, cloud_points, output_dir=None):
         leaves_data: Liste des données de feuilles
         cloud_points: Points du nuage complet
         output_dir: Répertoire de sortie pour les visualisations
+        dpi: Résolution de l'image sauvegardée
     
     Returns:
         Liste des feuilles sélectionnées (dictionnaires) dans l'ordre spécifié
@@ -39,74 +49,92 @@ def select_leaf_with_matplotlib(leaves_data, cloud_points, output_dir=None):
     """
     print("\nPréparation de la visualisation des feuilles...")
     
+    # Import différé: matplotlib n'est chargé que si la sélection est affichée
+    from matplotlib.lines import Line2D
+    
     # Créer une figure 3D
-    fig = plt.figure(figsize=(12, 10))
-    ax = fig.add_subplot(111, projection='3d')
+    fig, ax = _make_3d_fig((12, 10))
     
     # Afficher le nuage complet en noir (échantillonné pour performance)
-    max_display_points = 5000
-    if len(cloud_points) > max_display_points:
-        sample_indices = np.random.choice(len(cloud_points), max_display_points, replace=False)
-        display_points = cloud_points[sample_indices]
-    else:
-        display_points = cloud_points
+    display_points = sample_points(cloud_points, 5000)
         
-    ax.scatter(display_points[:, 0], display_points[:, 1], display_points[:, 2],
-              c='black', s=1, alpha=0.4, label='Nuage de points')
+    # depthshade=False: pas de recalcul des couleurs à chaque rotation
+    # (invisible sur des points noirs semi-transparents)
+    cloud_artist = ax.scatter(display_points[:, 0], display_points[:, 1], display_points[:, 2],
+                              c='black', s=1, alpha=0.4, depthshade=False, label='Nuage de points')
     
     # Générer des couleurs distinctes pour les feuilles
     colors = generate_distinct_colors(len(leaves_data))
     
-    # Afficher chaque feuille avec son ID
+    # Regrouper les points, centroïdes et normales de toutes les feuilles pour
+    # un seul appel scatter/quiver par type (au lieu d'un artiste par feuille)
+    max_leaf_points = 500
+    normal_length = 0.05  # 5 cm
+    points_blocks = []
+    points_colors = []
+    centroids = []
+    normal_origins = []
+    normal_vectors = []
+    
     for i, leaf in enumerate(leaves_data):
         # Obtenir les points de cette feuille (si disponibles)
         if 'points' in leaf:
-            leaf_points = np.array(leaf['points'])
+            # float32: deux fois moins d'octets vers matplotlib, sans copie si déjà float32
+            leaf_points = np.asarray(leaf['points'], dtype=np.float32)
             
             # Échantillonner si trop de points
-            max_leaf_points = 500
-            if len(leaf_points) > max_leaf_points:
-                sample_indices = np.random.choice(len(leaf_points), max_leaf_points, replace=False)
-                leaf_points = leaf_points[sample_indices]
+            leaf_points = sample_points(leaf_points, max_leaf_points)
             
-            # Afficher les points
-            ax.scatter(leaf_points[:, 0], leaf_points[:, 1], leaf_points[:, 2],
-                      c=[colors[i]], s=15, label=f'Feuille {leaf["id"]}')
+            points_blocks.append(leaf_points)
+            points_colors.append(np.repeat([colors[i]], len(leaf_points), axis=0))
         
-        # Afficher le centroïde
         centroid = leaf['centroid']
-        ax.scatter([centroid[0]], [centroid[1]], [centroid[2]], 
-                  c=[colors[i]], s=100, marker='o', edgecolors='black')
+        centroids.append(centroid)
         
-        # Afficher la normale (comme une flèche)
         if 'normal' in leaf:
-            normal = leaf['normal']
-            normal_length = 0.05  # 5 cm
-            arrow_end = [
-                centroid[0] + normal[0] * normal_length,
-                centroid[1] + normal[1] * normal_length,
-                centroid[2] + normal[2] * normal_length
-            ]
-            ax.quiver(centroid[0], centroid[1], centroid[2],
-                     normal[0] * normal_length, normal[1] * normal_length, normal[2] * normal_length,
-                     color='red', arrow_length_ratio=0.2)
-        
-        # Ajouter un texte avec l'ID légèrement décalé du centroïde
-        # Calculer un décalage basé sur la normale pour que le texte soit visible
-        offset = np.array([0, 0, 0.01])  # Décalage de base (1 cm vers le haut)
-        
-        # Si une normale est disponible, utiliser son orientation pour décaler perpendiculairement
-        if 'normal' in leaf:
-            normal = np.array(leaf['normal'])
-            # Créer un vecteur perpendiculaire à la normale
-            if abs(normal[0]) > 0.1 or abs(normal[1]) > 0.1:
-                # Si la normale n'est pas verticale, on peut créer facilement un vecteur perpendiculaire
-                perp = np.array([normal[1], -normal[0], 0])
-                perp = perp / np.linalg.norm(perp) * 0.01  # Normaliser à 1 cm
-                offset = perp
-            else:
-                # Si la normale est presque verticale, utiliser un décalage standard
-                offset = np.array([0.01, 0.01, 0.01])
+            normal_origins.append(centroid)
+            normal_vectors.append(np.asarray(leaf['normal'], dtype=float) * normal_length)
+    
+    # Afficher les points de toutes les feuilles
+    if points_blocks:
+        all_points = np.concatenate(points_blocks)
+        ax.scatter(all_points[:, 0], all_points[:, 1], all_points[:, 2],
+                   c=np.concatenate(points_colors), s=15)
+    
+    # Afficher les centroïdes
+    if centroids:
+        centroids = np.asarray(centroids, dtype=float)
+        ax.scatter(centroids[:, 0], centroids[:, 1], centroids[:, 2],
+                   c=colors, s=100, marker='o', edgecolors='black')
+    
+    # Afficher les normales (comme des flèches)
+    if normal_origins:
+        origins = np.asarray(normal_origins, dtype=float)
+        vectors = np.asarray(normal_vectors)
+        ax.quiver(origins[:, 0], origins[:, 1], origins[:, 2],
+                  vectors[:, 0], vectors[:, 1], vectors[:, 2],
+                  color='red', arrow_length_ratio=0.2)
+    
+    # Décalage du texte de chaque ID par rapport au centroïde, calculé pour
+    # toutes les feuilles à la fois à partir des normales
+    n_leaves = len(leaves_data)
+    has_normal = np.array(['normal' in leaf for leaf in leaves_data], dtype=bool)
+    normals = np.array([leaf.get('normal', [0, 0, 1]) for leaf in leaves_data], dtype=float).reshape(n_leaves, 3)
+    
+    # Décalage de base (1 cm vers le haut) pour les feuilles sans normale
+    offsets = np.tile([0.0, 0.0, 0.01], (n_leaves, 1))
+    
+    # Normale non verticale: vecteur perpendiculaire à la normale, normalisé à 1 cm
+    tilted = has_normal & ((np.abs(normals[:, 0]) > 0.1) | (np.abs(normals[:, 1]) > 0.1))
+    perps = np.column_stack([normals[:, 1], -normals[:, 0], np.zeros(n_leaves)])
+    offsets[tilted] = perps[tilted] / np.linalg.norm(perps[tilted], axis=1, keepdims=True) * 0.01
+    
+    # Normale presque verticale: décalage standard
+    offsets[has_normal & ~tilted] = 0.01
+    
+    # Ajouter un texte avec l'ID légèrement décalé du centroïde
+    for leaf, offset in zip(leaves_data, offsets):
+        centroid = leaf['centroid']
         
         # Position du texte
         text_pos = np.array(centroid) + offset
@@ -117,37 +145,19 @@ def select_leaf_with_matplotlib(leaves_data, cloud_points, output_dir=None):
                horizontalalignment='center', verticalalignment='center',
                bbox=dict(facecolor='white', alpha=0.7, edgecolor='black', boxstyle='round,pad=0.3'))
     
-    # Configurer les axes
-    ax.set_xlabel('X (m)')
-    ax.set_ylabel('Y (m)')
-    ax.set_zlabel('Z (m)')
-    ax.set_title('Feuilles identifiées', fontsize=16)
-    
-    # CORRECTION : Inverser les axes X et Y pour une orientation plus intuitive
-    # Cela place le point (0,0) plus près de nous
-    ax.invert_xaxis()
-    ax.invert_yaxis()
+    # Configurer les axes et l'orientation de la vue
+    _configure_axes(ax, 'Feuilles identifiées')
     
-    # CORRECTION : Ajuster la vue pour une meilleure orientation
-    ax.view_init(elev=20, azim=60)
-    
-    # Afficher la légende si pas trop de feuilles
+    # Afficher la légende si pas trop de feuilles (une entrée par feuille avec points)
     if len(leaves_data) <= 10:
-        ax.legend()
-    
-    # Sauvegarder l'image avant affichage
-    plt.tight_layout()
+        handles = [cloud_artist] + [
+            Line2D([], [], linestyle='', marker='o', color=colors[i], label=f'Feuille {leaf["id"]}')
+            for i, leaf in enumerate(leaves_data) if 'points' in leaf
+        ]
+        ax.legend(handles=handles)
     
-    if output_dir:
-        visualization_path = os.path.join(output_dir, 'leaves_selection.png')
-        plt.savefig(visualization_path, dpi=300)
-        print(f"Visualisation sauvegardée dans '{visualization_path}'")
-    else:
-        plt.savefig('leaves_selection.png', dpi=300)
-        print("Visualisation sauvegardée dans 'leaves_selection.png'")
-    
-    # Afficher la figure
-    plt.show()
+    # Sauvegarder l'image, l'afficher puis libérer la figure
+    _save_and_close(fig, output_dir, 'leaves_selection.png', "des feuilles", dpi, show=True)
     
     # Afficher un tableau récapitulatif dans le terminal
     print("\n=== FEUILLES IDENTIFIÉES ===")
@@ -160,6 +170,9 @@ def select_leaf_with_matplotlib(leaves_data, cloud_points, output_dir=None):
         print(f"{leaf['id']:2d} | ({centroid[0]:.3f}, {centroid[1]:.3f}, {centroid[2]:.3f}) | "
               f"({normal[0]:.3f}, {normal[1]:.3f}, {normal[2]:.3f})")
     
+    # Index des feuilles par ID (recherche en temps constant)
+    id_to_leaf = {leaf['id']: leaf for leaf in leaves_data}
+    
     # Demander à l'utilisateur de sélectionner plusieurs feuilles
     while True:
         try:
@@ -173,20 +186,14 @@ def select_leaf_with_matplotlib(leaves_data, cloud_points, output_dir=None):
             selected_ids = [int(id_str) for id_str in selection_input.split()]
             
             # Vérifier si tous les IDs sont valides
-            leaf_ids = [leaf['id'] for leaf in leaves_data]
-            invalid_ids = [id for id in selected_ids if id not in leaf_ids]
+            invalid_ids = [id for id in selected_ids if id not in id_to_leaf]
             
             if invalid_ids:
                 print(f"Erreur: Les IDs suivants n'existent pas: {invalid_ids}. Veuillez réessayer.")
                 continue
             
             # Créer la liste des feuilles sélectionnées dans l'ordre spécifié
-            selected_leaves = []
-            for selected_id in selected_ids:
-                for leaf in leaves_data:
-                    if leaf['id'] == selected_id:
-                        selected_leaves.append(leaf)
-                        break
+            selected_leaves = [id_to_leaf[selected_id] for selected_id in selected_ids]
             
             if not selected_leaves:
                 print("Aucune feuille valide sélectionnée. Veuillez réessayer.")
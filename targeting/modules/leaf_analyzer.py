@@ -1,10 +1,12 @@
 # modules/leaf_analyzer.py
 import numpy as np
-import open3d as o3d
 from scipy.spatial import cKDTree
+from scipy import sparse
 import networkx as nx
-import random
+import os
+import math
 import time
+from concurrent.futures import ProcessPoolExecutor
 
 try:
     import community as community_louvain
@@ -14,9 +16,42 @@ except ImportError:
     print("ERREUR: Le package 'python-louvain' n'est pas installé.")
     print("Pour l'installer: pip install python-louvain")
 
-def calculate_adaptive_radius(points):
+# Louvain en C (optionnel): utilisé à la place de python-louvain s'il est installé
+try:
+    import igraph as ig
+    IGRAPH_AVAILABLE = True
+except ImportError:
+    IGRAPH_AVAILABLE = False
+
+# Leiden (optionnel, nécessite igraph, activé par --leiden): une seule exécution
+# suffit grâce à l'étape de raffinement
+try:
+    import leidenalg
+    LEIDEN_AVAILABLE = IGRAPH_AVAILABLE
+except ImportError:
+    LEIDEN_AVAILABLE = False
+
+# Part minimale de points proches du plan des moindres carrés (SVD) pour l'accepter
+# sans RANSAC (même valeur que le ratio d'inliers minimal d'une feuille)
+SVD_MIN_INLIER_RATIO = 0.7
+# Itérations RANSAC: nombre de tirages garantissant (à 99,9 %) un tirage de 3 inliers
+# pour le ratio d'inliers minimal accepté (0.7), avec un plancher de 100
+RANSAC_ITERATIONS = max(100, math.ceil(math.log(1 - 0.999) / math.log(1 - 0.7 ** 3)))
+
+def build_point_tree(points):
+    """
+    Construit le KDTree partagé par calculate_adaptive_radius et build_connectivity_graph
+    
+    balanced_tree=False: découpe au milieu de l'étendue plutôt qu'à la médiane,
+    construction plus rapide sur un nuage de plante très inégalement réparti.
+    """
+    return cKDTree(points, balanced_tree=False, compact_nodes=True)
+
+def calculate_adaptive_radius(points, tree=None):
     """
     Calcule un rayon de connectivité adaptatif
+    
+    tree: KDTree déjà construit sur points (optionnel, voir build_point_tree)
     """
     if len(points) < 10:
         return 0.01
@@ -26,20 +61,16 @@ def calculate_adaptive_radius(points):
     sample_indices = np.random.choice(len(points), sample_size, replace=False)
     sample_points = points[sample_indices]
     
-    # Créer un KDTree sur TOUS les points originaux
-    full_tree = cKDTree(points)
+    # KDTree sur TOUS les points originaux (réutilisé s'il est fourni)
+    full_tree = tree if tree is not None else build_point_tree(points)
     
-    # Pour chaque point échantillonné, trouver son plus proche voisin
-    all_distances = []
-    for point in sample_points:
-        # Chercher les 2 plus proches voisins (le premier étant le point lui-même)
-        distances, _ = full_tree.query(point, k=2)
-        # Ignorer la distance à soi-même (première distance = 0)
-        neighbor_distance = distances[1]
-        all_distances.append(neighbor_distance)
+    # Chercher en une seule requête les 2 plus proches voisins de chaque point
+    # échantillonné (le premier étant le point lui-même), sur tous les cœurs
+    distances, _ = full_tree.query(sample_points, k=2, workers=-1)
     
     # Calculer la distance moyenne au premier voisin le plus proche
-    avg_1nn = np.mean(all_distances)
+    # (en ignorant la distance à soi-même, première colonne = 0)
+    avg_1nn = np.mean(distances[:, 1])
     
     # Rayon adaptatif: 5x distance moyenne au plus proche voisin
     adaptive_radius = avg_1nn * 5.0
@@ -73,114 +104,259 @@ def calculate_auto_louvain_coefficient(points):
     
     return auto_coeff
 
-def build_connectivity_graph(points, radius):
+def build_connectivity_graph(points, radius, tree=None):
     """
     Construit le graphe de connectivité
     Adapté de alpha_louvain_interactive.py
+    
+    tree: KDTree déjà construit sur points (optionnel, voir build_point_tree)
+    
+    Returns:
+        Matrice d'adjacence pondérée symétrique (scipy.sparse CSR, N x N, poids
+        float32): ~16 octets par arête au lieu des dictionnaires imbriqués de networkx
     """
     start_time = time.time()
     
-    # Créer un graphe vide
-    graph = nx.Graph()
+    # Toutes les paires de points à moins de `radius` en un seul appel (i < j, sans doublons)
+    if tree is None:
+        tree = build_point_tree(points)
+    pairs = tree.query_pairs(radius, output_type='ndarray')
+    
+    # Poids de toutes les arêtes: inverse de la distance euclidienne
+    # (opérations en place: un seul tampon de taille n_arêtes réutilisé)
+    diffs = points[pairs[:, 0]]
+    diffs -= points[pairs[:, 1]]
+    weights = np.einsum('ij,ij->i', diffs, diffs)
+    del diffs
+    np.sqrt(weights, out=weights)
+    np.maximum(weights, 1e-6, out=weights)
+    np.reciprocal(weights, out=weights)
+    
+    # La simple précision suffit pour des poids relatifs: adjacence deux fois plus légère
+    weights = weights.astype(np.float32)
+    
+    # Adjacence symétrique en une passe (un nœud par point, même isolé)
+    n_points = len(points)
+    upper = sparse.coo_matrix((weights, (pairs[:, 0], pairs[:, 1])), shape=(n_points, n_points))
+    graph = (upper + upper.T).tocsr()
+    
+    print(f"Graphe: {n_points} nœuds, {len(pairs)} arêtes")
+    print(f"Temps: {time.time() - start_time:.2f}s")
     
-    # Ajouter les nœuds (un par point)
-    for i in range(len(points)):
-        graph.add_node(i)
+    return graph
+
+def _to_igraph(graph):
+    """Convertit l'adjacence CSR en igraph.Graph pondéré (attribut 'weight')"""
+    # Chaque arête une seule fois: triangle supérieur de l'adjacence
+    upper = sparse.triu(graph, k=1).tocoo()
+    return ig.Graph(
+        n=graph.shape[0],
+        edges=np.column_stack([upper.row, upper.col]).tolist(),
+        edge_attrs={'weight': upper.data.tolist()}
+    )
+
+def _modularity_resolution(resolution):
+    """
+    Convertit la résolution de python-louvain en résolution γ d'igraph/leidenalg
     
-    # Utiliser un KDTree pour la recherche efficace des voisins
-    tree = cKDTree(points)
+    La résolution de python-louvain est le « temps de Markov » t de Lambiotte et
+    al. (Laplacian Dynamics and Multiscale Modular Structure in Networks): la
+    modularité qu'il utilise pour accepter chaque niveau d'agrégation pondère le
+    terme interne par t, ce qui équivaut à la modularité standard avec γ = 1/t
+    sur le terme du modèle nul. igraph et leidenalg attendent γ: sans conversion,
+    --louvain_coeff 0.5 donne γ = 0.5 (communautés plus grandes, feuilles
+    fusionnées) au lieu de γ = 2. La conversion est exacte: les deux objectifs
+    ne diffèrent que d'un facteur t constant et ont donc les mêmes optima.
     
-    # Pour chaque point, trouver ses voisins dans le rayon spécifié
-    for i in range(len(points)):
-        # Trouver les indices des voisins
-        indices = tree.query_ball_point(points[i], radius)
-        
-        # Ajouter des arêtes vers les voisins
-        for j in indices:
-            if i < j:  # Pour éviter les doublons
-                # Calculer la distance euclidienne
-                dist = np.linalg.norm(points[i] - points[j])
-                
-                # Le poids est l'inverse de la distance
-                weight = 1.0 / max(dist, 1e-6)
-                
-                graph.add_edge(i, j, weight=weight)
+    Args:
+        resolution: Résolution au sens de python-louvain (--louvain_coeff)
         
-        # Afficher la progression
-        if i % 5000 == 0 or i == len(points) - 1:
-            print(f"  Progression: {i+1}/{len(points)} points")
+    Returns:
+        Résolution γ équivalente
+    """
+    return 1.0 / resolution
+
+def _leiden(graph, resolution):
+    """
+    Détection de communautés avec Leiden (leidenalg)
     
-    print(f"Graphe: {graph.number_of_nodes()} nœuds, {graph.number_of_edges()} arêtes")
-    print(f"Temps: {time.time() - start_time:.2f}s")
+    Le raffinement de Leiden garantit des communautés connexes et atteint en une
+    exécution la qualité que Louvain n'obtient qu'en gardant la meilleure de
+    plusieurs exécutions.
     
-    return graph
-
-def detect_communities_louvain_multiple(graph, resolution, min_size, n_iterations=5):
+    Args:
+        graph: Adjacence CSR renvoyée par build_connectivity_graph
+        resolution: Résolution au sens de python-louvain (convertie en γ)
+    
+    Returns:
+        Tuple (partition {nœud: communauté}, modularité)
     """
-    Détecte les communautés avec Louvain randomisé
-    Adapté de alpha_louvain_interactive.py
+    start_time = time.time()
+    ig_graph = _to_igraph(graph)
+    
+    partition = leidenalg.find_partition(
+        ig_graph, leidenalg.RBConfigurationVertexPartition,
+        weights='weight', resolution_parameter=_modularity_resolution(resolution),
+        n_iterations=2, seed=0
+    )
+    modularity = ig_graph.modularity(partition.membership, weights='weight')
+    
+    print(f"  Leiden: Modularité = {modularity:.4f}, Temps = {time.time() - start_time:.2f}s")
+    
+    return dict(enumerate(partition.membership)), modularity
+
+def _louvain_igraph(graph, resolution, n_iterations):
     """
-    if not LOUVAIN_AVAILABLE:
-        print("Erreur: Module python-louvain non disponible")
-        return []
-        
-    if n_iterations <= 0:
-        print("ERREUR: Le nombre d'itérations doit être positif.")
-        return []
+    Louvain randomisé avec igraph (implémentation C)
     
-    best_partition = None
-    best_modularity = -1
-    best_communities = []
+    igraph visite les nœuds dans un ordre aléatoire à chaque appel: pas besoin
+    de reconstruire un graphe réordonné.
+    
+    Args:
+        graph: Adjacence CSR renvoyée par build_connectivity_graph
+        resolution: Résolution au sens de python-louvain (convertie en γ)
+        n_iterations: Nombre d'exécutions de Louvain
     
-    print(f"Exécution de Louvain {n_iterations} fois avec ordre aléatoire...")
+    Returns:
+        Tuple (partition {nœud: communauté}, modularité) de la meilleure itération
+    """
+    ig_graph = _to_igraph(graph)
+    gamma = _modularity_resolution(resolution)
     
-    # Créer une copie du graphe pour ne pas le modifier
-    graph_copy = graph.copy()
+    best_membership = None
+    best_modularity = -1
     
     for i in range(n_iterations):
         start_time = time.time()
         
-        # Réordonner aléatoirement les nœuds
-        shuffled_nodes = list(graph_copy.nodes())
-        random.shuffle(shuffled_nodes)
-        
-        # Créer un dictionnaire de correspondance
-        node_map = {old: new for new, old in enumerate(shuffled_nodes)}
-        reverse_map = {new: old for new, old in enumerate(shuffled_nodes)}
-        
-        # Créer un nouveau graphe avec les nœuds réordonnés
-        shuffled_graph = nx.Graph()
-        for old_u, old_v, data in graph_copy.edges(data=True):
-            new_u, new_v = node_map[old_u], node_map[old_v]
-            shuffled_graph.add_edge(new_u, new_v, **data)
+        clustering = ig_graph.community_multilevel(weights='weight', resolution=gamma)
+        modularity = ig_graph.modularity(clustering.membership, weights='weight')
         
-        # Exécuter Louvain sur le graphe réordonné
-        partition = community_louvain.best_partition(shuffled_graph, resolution=resolution)
-        
-        # Calculer la modularité de cette partition
-        modularity = community_louvain.modularity(partition, shuffled_graph)
-        
-        # Mapper la partition aux nœuds originaux
-        original_partition = {reverse_map[node]: comm for node, comm in partition.items()}
-        
-        # Si c'est la meilleure modularité jusqu'à présent, on la garde
         if modularity > best_modularity:
             best_modularity = modularity
-            best_partition = original_partition
+            best_membership = clustering.membership
         
         print(f"  Itération {i+1}/{n_iterations}: Modularité = {modularity:.4f}, Temps = {time.time() - start_time:.2f}s")
     
+    return dict(enumerate(best_membership)), best_modularity
+
+def _louvain_networkx_run(graph, resolution, seed):
+    """
+    Une exécution de python-louvain (dans un processus de travail)
+    
+    Args:
+        graph: Adjacence CSR (plus légère à transmettre qu'un graphe networkx)
+        resolution: Résolution de Louvain
+        seed: Graine de l'ordre de visite des nœuds
+        
+    Returns:
+        Tuple (partition {nœud: communauté}, modularité, durée en secondes)
+    """
+    start_time = time.time()
+    
+    # python-louvain travaille sur un graphe networkx (attribut 'weight')
+    nx_graph = nx.from_scipy_sparse_array(graph)
+    
+    # Exécuter Louvain avec un ordre de visite propre à cette graine
+    partition = community_louvain.best_partition(nx_graph, resolution=resolution, random_state=seed)
+    
+    # Calculer la modularité de cette partition
+    modularity = community_louvain.modularity(partition, nx_graph)
+    
+    return partition, modularity, time.time() - start_time
+
+def _louvain_networkx(graph, resolution, n_iterations):
+    """
+    Louvain randomisé avec python-louvain
+    
+    best_partition mélange lui-même l'ordre des nœuds selon random_state: une
+    graine par itération suffit, sans reconstruire de graphe réordonné. Les
+    itérations sont indépendantes et s'exécutent en parallèle sur plusieurs
+    processus (python-louvain est en Python pur, limité par le GIL).
+    
+    Returns:
+        Tuple (partition {nœud: communauté}, modularité) de la meilleure itération
+    """
+    best_partition = None
+    best_modularity = -1
+    
+    max_workers = min(n_iterations, os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            _louvain_networkx_run,
+            [graph] * n_iterations, [resolution] * n_iterations, range(n_iterations)
+        )
+        
+        for i, (partition, modularity, duration) in enumerate(results):
+            # Si c'est la meilleure modularité jusqu'à présent, on la garde
+            if modularity > best_modularity:
+                best_modularity = modularity
+                best_partition = partition
+            
+            print(f"  Itération {i+1}/{n_iterations}: Modularité = {modularity:.4f}, Temps = {duration:.2f}s")
+    
+    return best_partition, best_modularity
+
+def detect_communities_louvain_multiple(graph, resolution, min_size, n_iterations=5, use_leiden=False):
+    """
+    Détecte les communautés avec Louvain randomisé (ou Leiden sur demande)
+    Adapté de alpha_louvain_interactive.py
+    
+    Args:
+        graph: Adjacence CSR renvoyée par build_connectivity_graph
+        resolution: Résolution au sens de python-louvain (temps de Markov), quel
+            que soit l'algorithme utilisé (voir _modularity_resolution)
+        min_size: Taille minimale d'une communauté conservée
+        n_iterations: Nombre d'exécutions de Louvain (Leiden s'exécute une fois)
+        use_leiden: Utiliser Leiden au lieu de Louvain (nécessite leidenalg)
+    """
+    if not LOUVAIN_AVAILABLE and not IGRAPH_AVAILABLE:
+        print("Erreur: Module python-louvain non disponible")
+        return []
+        
+    if n_iterations <= 0:
+        print("ERREUR: Le nombre d'itérations doit être positif.")
+        return []
+    
+    if use_leiden:
+        if LEIDEN_AVAILABLE:
+            # Une seule exécution: n_iterations ne concerne que Louvain
+            print("Exécution de Leiden (leidenalg, une exécution)...")
+            best_partition, best_modularity = _leiden(graph, resolution)
+            return _group_communities(best_partition, best_modularity, min_size)
+        print("ATTENTION: Leiden demandé mais leidenalg/igraph non disponible, utilisation de Louvain")
+    
+    if IGRAPH_AVAILABLE:
+        print(f"Exécution de Louvain (igraph) {n_iterations} fois avec ordre aléatoire...")
+        best_partition, best_modularity = _louvain_igraph(graph, resolution, n_iterations)
+    else:
+        print(f"Exécution de Louvain (python-louvain) {n_iterations} fois avec ordre aléatoire...")
+        best_partition, best_modularity = _louvain_networkx(graph, resolution, n_iterations)
+    
+    return _group_communities(best_partition, best_modularity, min_size)
+
+def _group_communities(best_partition, best_modularity, min_size):
+    """
+    Regroupe les nœuds par communauté, filtre les petites et trie par taille
+    
+    Returns:
+        Liste de tableaux d'indices triés (int32), de la plus grande à la plus
+        petite communauté
+    """
     print(f"Meilleure modularité: {best_modularity:.4f}")
     
-    # Regrouper les nœuds par communauté
-    communities = {}
-    for node, community_id in best_partition.items():
-        if community_id not in communities:
-            communities[community_id] = set()
-        communities[community_id].add(node)
+    # Étiquette de communauté de chaque nœud (les nœuds sont numérotés 0..N-1)
+    labels = np.empty(len(best_partition), dtype=np.int64)
+    labels[np.fromiter(best_partition.keys(), dtype=np.int64, count=len(best_partition))] = \
+        np.fromiter(best_partition.values(), dtype=np.int64, count=len(best_partition))
+    
+    # Regrouper les nœuds par communauté: un tri stable donne des indices déjà triés
+    order = np.argsort(labels, kind='stable').astype(np.int32)
+    _, starts = np.unique(labels[order], return_index=True)
+    communities = np.split(order, starts[1:])
     
     # Filtrer les communautés trop petites
-    filtered_communities = [comm for comm in communities.values() if len(comm) >= min_size]
+    filtered_communities = [comm for comm in communities if len(comm) >= min_size]
     
     # Trier par taille décroissante
     sorted_communities = sorted(filtered_communities, key=len, reverse=True)
@@ -196,15 +372,51 @@ def detect_communities_louvain_multiple(graph, resolution, min_size, n_iteration
     
     return sorted_communities
 
-def fit_plane_to_points(points, all_points=None, distance_threshold=0.005, ransac_n=3, num_iterations=1000):
+def _ransac_plane_np(points, distance_threshold, num_iterations, seed=0):
+    """
+    Ajustement de plan RANSAC vectorisé: toutes les hypothèses sont évaluées
+    sur tous les points en un seul produit matriciel
+    
+    Args:
+        points: Points (N, 3)
+        distance_threshold: Distance maximale d'un inlier au plan
+        num_iterations: Nombre de triplets tirés
+        seed: Graine du générateur (résultat reproductible)
+        
+    Returns:
+        Tuple (normale unitaire, d, indices des inliers) du plan ax + by + cz + d = 0
+    """
+    rng = np.random.default_rng(seed)
+    
+    # Un triplet de points par itération et la normale du plan qui les contient
+    samples = points[rng.integers(0, len(points), size=(num_iterations, 3))]
+    normals = np.cross(samples[:, 1] - samples[:, 0], samples[:, 2] - samples[:, 0])
+    norms = np.linalg.norm(normals, axis=1)
+    
+    # Ignorer les triplets dégénérés (points confondus ou alignés)
+    valid = norms > 1e-12
+    if not np.any(valid):
+        raise ValueError("Aucun triplet non dégénéré pour RANSAC")
+    normals = normals[valid] / norms[valid, None]
+    offsets = -np.einsum('ij,ij->i', normals, samples[valid, 0])
+    
+    # Nombre d'inliers de chaque hypothèse (N x hypothèses)
+    inlier_mask = np.abs(points @ normals.T + offsets) < distance_threshold
+    best = int(np.argmax(np.count_nonzero(inlier_mask, axis=0)))
+    
+    return normals[best], float(offsets[best]), np.flatnonzero(inlier_mask[:, best])
+
+def fit_plane_to_points(points, plant_center=None, distance_threshold=0.005, ransac_n=3,
+                        num_iterations=RANSAC_ITERATIONS):
     """
     Ajuste un plan à un ensemble de points via RANSAC et oriente la normale vers l'extérieur
     
     Args:
         points: Points de la communauté (feuille)
-        all_points: Tous les points du nuage (pour calculer le centre de la plante)
+        plant_center: Centre de la plante (centroïde de tous les points du nuage),
+            calculé une seule fois par l'appelant
         distance_threshold: Seuil de distance pour RANSAC
-        ransac_n: Nombre de points pour RANSAC
+        ransac_n: Nombre de points pour RANSAC (seul 3 est pris en charge)
         num_iterations: Nombre d'itérations pour RANSAC
         
     Returns:
@@ -220,52 +432,44 @@ def fit_plane_to_points(points, all_points=None, distance_threshold=0.005, ransa
             'inliers': []
         }
     
-    # Déterminer le centre de la plante (centroïde de tous les points)
-    if all_points is None:
-        # Si all_points n'est pas fourni, utiliser le centroïde des points XY comme référence
-        # mais avec une hauteur Z minimale
+    if plant_center is None:
+        # Si le centre de la plante n'est pas fourni, utiliser le centroïde des points XY
+        # comme référence mais avec une hauteur Z minimale
         xy_centroid = np.mean(points[:, :2], axis=0)
         min_z = np.min(points[:, 2])
         plant_center = np.array([xy_centroid[0], xy_centroid[1], min_z])
-    else:
-        # Utiliser le centroïde de tous les points comme centre de la plante
-        plant_center = np.mean(all_points, axis=0)
     
-    # Créer un nuage de points Open3D
-    pcd = o3d.geometry.PointCloud()
-    pcd.points = o3d.utility.Vector3dVector(points)
+    # Calculer le barycentre
+    centroid = np.mean(points, axis=0)
     
-    # Estimer les normales
-    pcd.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamHybrid(radius=0.02, max_nn=30))
-    
-    # Ajuster un plan avec RANSAC
     try:
-        plane_model, inliers = pcd.segment_plane(distance_threshold=distance_threshold,
-                                               ransac_n=ransac_n,
-                                               num_iterations=num_iterations)
-        
-        # Extraire les paramètres du plan: ax + by + cz + d = 0
-        [a, b, c, d] = plane_model
+        # Plan des moindres carrés par SVD (un seul appel LAPACK): la normale est
+        # la direction de plus faible variance des points centrés
+        centered = points - centroid
+        _, _, vt = np.linalg.svd(centered, full_matrices=False)
+        normal = vt[-1]
+        a, b, c = normal.tolist()
+        d = -float(normal @ centroid)
+        inliers = np.flatnonzero(np.abs(centered @ normal) < distance_threshold).tolist()
         
-        # Normaliser le vecteur normal
-        normal = np.array([a, b, c])
-        normal_length = np.linalg.norm(normal)
-        if normal_length > 0:
-            normal = normal / normal_length
+        # Feuille trop peu plane pour les moindres carrés (points aberrants): RANSAC
+        if len(inliers) < SVD_MIN_INLIER_RATIO * len(points):
+            # RANSAC en NumPy: pas de copie vers un nuage Open3D pour quelques
+            # centaines de points
+            normal, d, inliers = _ransac_plane_np(points, distance_threshold, num_iterations)
+            a, b, c = normal.tolist()
+            inliers = inliers.tolist()
         
         # Calculer le pourcentage d'inliers
         inlier_ratio = len(inliers) / len(points) if len(points) > 0 else 0
         
-        # Calculer le barycentre
-        centroid = np.mean(points, axis=0)
-        
         # Vérifier l'orientation de la normale (pour qu'elle pointe "vers l'extérieur")
         direction_to_center = plant_center - centroid
         
         # Si la normale pointe vers le centre, l'inverser
         # Utiliser une marge pour éviter les cas limites
-        dot_product = np.dot(normal, direction_to_center)
-        if dot_product > 0.1 * np.linalg.norm(direction_to_center):
+        dot_product = float(normal @ direction_to_center)
+        if dot_product > 0.1 * math.sqrt(direction_to_center @ direction_to_center):
             normal = -normal
             a, b, c = -a, -b, -c
             d = -d
@@ -292,31 +496,12 @@ def fit_plane_to_points(points, all_points=None, distance_threshold=0.005, ransa
             'inliers': []
         }
 
-def calculate_target_point(leaf_data, distance=0.10):
-    """
-    Calcule le point cible à une distance donnée du plan de la feuille
-    
-    Args:
-        leaf_data: Dictionnaire contenant les données de la feuille
-        distance: Distance souhaitée du plan (en mètres)
-    
-    Returns:
-        Coordonnées du point cible [x, y, z]
-    """
-    centroid = np.array(leaf_data['centroid'])
-    normal = np.array(leaf_data['normal'])
-    
-    # Calculer le point cible en suivant la normale
-    target_point = centroid + normal * distance
-    
-    return target_point.tolist()
-
 def extract_leaf_data_from_communities(communities, points, min_inlier_ratio=0.7, distance=0.1):
     """
     Extrait les données des feuilles à partir des communautés détectées
     
     Args:
-        communities: Liste des communautés (ensemble d'indices)
+        communities: Liste des communautés (tableaux d'indices triés)
         points: Nuage de points complet
         min_inlier_ratio: Ratio minimum d'inliers pour considérer une surface comme valide
         distance: Distance aux feuilles en mètres pour le calcul des points cibles
@@ -326,57 +511,67 @@ def extract_leaf_data_from_communities(communities, points, min_inlier_ratio=0.7
     """
     leaves_data = []
     
-    # Calculer le centre approximatif de la plante
-    plant_center = np.mean(points, axis=0)
-    # Utiliser une hauteur minimale pour le centre (base de la plante)
+    # Centroïde de tous les points, calculé une seule fois: centre utilisé par
+    # fit_plane_to_points pour toutes les communautés
+    all_points_center = np.mean(points, axis=0)
+    
+    # Centre approximatif de la plante, à hauteur minimale (base de la plante)
+    plant_center = all_points_center.copy()
     plant_center[2] = np.min(points[:, 2])
     
     print(f"\nUtilisation d'une distance de {distance*100:.1f} cm pour calculer les points cibles")
     
-    for i, community in enumerate(communities):
-        # Extraire les points de cette communauté
-        comm_indices = list(community)
+    # 1. Ajuster un plan à chaque communauté et garder celles de bonne qualité
+    accepted = []
+    for i, comm_indices in enumerate(communities):
+        # Extraire les points de cette communauté (indexation vectorisée)
         comm_points = points[comm_indices]
         
-        # Calculer le centroïde
-        centroid = np.mean(comm_points, axis=0)
-        
-        # Ajuster un plan à la communauté en passant tous les points
-        plane_info = fit_plane_to_points(comm_points, points)
+        # Ajuster un plan à la communauté (centre de la plante partagé)
+        plane_info = fit_plane_to_points(comm_points, plant_center=all_points_center)
         
         # Vérifier si le plan est de bonne qualité
         if plane_info['inlier_ratio'] < min_inlier_ratio:
             print(f"Communauté {i+1}: Ratio d'inliers trop faible ({plane_info['inlier_ratio']:.2f})")
             continue
         
-        # Double vérification de l'orientation de la normale vers l'extérieur
-        direction_to_center = plant_center - centroid
-        dot_product = np.dot(plane_info['normal'], direction_to_center)
-        if dot_product > 0:
-            # La normale pointe encore vers le centre - l'inverser
-            normal = -np.array(plane_info['normal'])
-            plane_info['normal'] = normal
-            # Inverser aussi l'équation du plan
-            a, b, c, d = plane_info['equation']
-            plane_info['equation'] = [-a, -b, -c, -d]
-            print(f"Communauté {i+1}: Normale réorientée vers l'extérieur")
-        
-        # Calculer le point cible à la distance spécifiée de la feuille
-        target_point = calculate_target_point(plane_info, distance=distance)
-        
-        # Créer l'entrée pour cette feuille
-        leaf_data = {
+        accepted.append((i, comm_indices, comm_points, plane_info))
+    
+    if not accepted:
+        print("Feuilles extraites: 0")
+        return leaves_data
+    
+    # 2. Double vérification de l'orientation des normales vers l'extérieur,
+    # pour toutes les feuilles à la fois
+    centroids = np.array([plane_info['centroid'] for _, _, _, plane_info in accepted])
+    normals = np.array([plane_info['normal'] for _, _, _, plane_info in accepted], dtype=float)
+    equations = np.array([plane_info['equation'] for _, _, _, plane_info in accepted], dtype=float)
+    
+    # Les normales qui pointent encore vers le centre sont inversées, avec leur équation
+    flip = np.einsum('ij,ij->i', normals, plant_center - centroids) > 0
+    normals[flip] *= -1
+    equations[flip] *= -1
+    for k in np.flatnonzero(flip):
+        print(f"Communauté {accepted[k][0]+1}: Normale réorientée vers l'extérieur")
+    
+    # Points cibles à la distance spécifiée de chaque feuille, le long de la normale
+    target_points = centroids + normals * distance
+    
+    # 3. Créer les entrées des feuilles
+    leaves_data = [
+        {
             "id": i + 1,  # ID commençant à 1
-            "centroid": centroid.tolist(),
-            "normal": plane_info["normal"].tolist(),
-            "plane_equation": plane_info["equation"],
+            "centroid": centroid,
+            "normal": normal,
+            "plane_equation": equation,
             "inlier_ratio": plane_info["inlier_ratio"],
             "points_indices": comm_indices,
             "points": comm_points.tolist(),
             "target_point": target_point
         }
-        
-        leaves_data.append(leaf_data)
+        for (i, comm_indices, comm_points, plane_info), centroid, normal, equation, target_point
+        in zip(accepted, centroids.tolist(), normals.tolist(), equations.tolist(), target_points.tolist())
+    ]
     
     print(f"Feuilles extraites: {len(leaves_data)}")
     return leaves_data
\ No newline at end of file
@@ -1,9 +1,21 @@
 # targeting/modules/robot_controller.py
 import time
 import math
+import functools
 import numpy as np
 import os
+import queue
+import threading
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
+from core.geometry.angle_calculator import normalize_angle_difference
+
+# Nombre maximal d'images capturées en attente d'écriture (borne la mémoire:
+# la capture se bloque si le support de stockage ne suit pas)
+PHOTO_QUEUE_SIZE = 8
+# Format de l'horodatage des noms de fichiers des photos
+PHOTO_TIMESTAMP_FORMAT = "%Y%m%d-%H%M%S"
 
 class RobotController:
     def __init__(self, cnc=None, camera=None, gimbal=None, output_dirs=None, speed=0.1, update_interval=0.1):
@@ -29,6 +41,16 @@ class RobotController:
         if output_dirs and 'images' in output_dirs:
             self.photos_dir = output_dirs['images']
         
+        # Exécuteur de la gimbal: orientation pendant le déplacement du CNC
+        # (actionneurs indépendants, les appels série libèrent le GIL)
+        self._gimbal_executor = ThreadPoolExecutor(max_workers=1)
+        
+        # File d'écriture des photos et son thread: le robot repart pendant
+        # l'encodage et l'écriture du fichier (la capture reste faite à l'arrêt)
+        self._photo_queue = queue.Queue(maxsize=PHOTO_QUEUE_SIZE)
+        self._photo_writer = threading.Thread(target=self._photo_writer_loop, daemon=True)
+        self._photo_writer.start()
+        
         # État
         self.initialized = cnc is not None and camera is not None and gimbal is not None
         
@@ -56,15 +78,34 @@ class RobotController:
             return False
         
         try:
+            # Centroïdes des feuilles convertis une seule fois en tableau (N, 3)
+            if leaf_centroids is not None:
+                leaf_centroids = np.asarray(leaf_centroids, dtype=float).reshape(-1, 3)
+            
             # Variables pour suivre les feuilles
             current_leaf_index = 0
             photos_taken = []
+            pending_photos = []
+            
+            # Mode de prise de photo fixé une fois pour toute la trajectoire
+            take_photo = self._take_auto_photo if auto_photo else self._take_prompted_photo
+            
+            # Méthodes des actionneurs résolues une fois pour toute la boucle
+            move_to = self.cnc.move_to
+            get_position = self.cnc.get_position
+            # Toujours attendre la fin du mouvement de la gimbal, tilt inversé
+            aim_at_target = functools.partial(self.gimbal.aim_at_target, wait=True, invert_tilt=True)
+            n_steps = len(path)
             
-            # Identifier les points cibles et les derniers points intermédiaires avant chaque cible
-            target_indices = []
+            # Identifier en une passe les derniers points intermédiaires avant chaque cible
+            # (un via_point suivi directement par un target) et l'indice de la feuille visée
+            next_leaf_index_at = [-1] * len(path)
+            leaf_counter = 0
             for i, point_info in enumerate(path):
                 if point_info["type"] == "target":
-                    target_indices.append(i)
+                    if i > 0 and path[i-1]["type"] == "via_point":
+                        next_leaf_index_at[i-1] = leaf_counter
+                    leaf_counter += 1
             
             # Parcourir le chemin
             for i, point_info in enumerate(path):
@@ -72,45 +113,44 @@ class RobotController:
                 point_type = point_info["type"]
                 comment = point_info.get("comment", "")
                 
-                print(f"\n--- Étape {i+1}/{len(path)}: {point_type} ---")
+                print(f"\n--- Étape {i+1}/{n_steps}: {point_type} ---")
                 if comment:
                     print(f"Info: {comment}")
                 
+                # Au dernier point intermédiaire avant un point cible (un via_point suivi
+                # directement par un target), orienter la caméra vers la prochaine feuille
+                # pendant le déplacement, depuis la position planifiée de ce point
+                aim_future = None
+                next_leaf_index = next_leaf_index_at[i]
+                if next_leaf_index >= 0 and leaf_centroids is not None and next_leaf_index < len(leaf_centroids):
+                    print(f"\n--- Orientation vers la feuille pendant le déplacement au dernier point intermédiaire ---")
+                    
+                    # Obtenir le centroïde de la prochaine feuille
+                    next_leaf_centroid = leaf_centroids[next_leaf_index]
+                    
+                    print(f"DEBUG: Orientation vers le centroïde: {next_leaf_centroid}")
+                    
+                    # Orienter la caméra vers le centroïde de la prochaine feuille
+                    aim_future = self._gimbal_executor.submit(
+                        aim_at_target, tuple(position), next_leaf_centroid
+                    )
+                
                 # Déplacement vers ce point
-                success = self.cnc.move_to(
+                success = move_to(
                     position[0], position[1], position[2], wait=True
                 )
                 
+                # Attendre la fin de l'orientation avant l'étape suivante
+                if aim_future is not None:
+                    if not aim_future.result():
+                        print("Erreur lors de l'orientation vers la feuille")
+                    else:
+                        print("Caméra orientée avec succès vers la feuille")
+                
                 if not success:
                     print(f"Erreur lors du déplacement à l'étape {i+1}")
                     continue
                 
-                # Vérifier si nous sommes au dernier point intermédiaire avant un point cible
-                # c'est-à-dire un point via_point suivi directement par un point target
-                if point_type == "via_point" and i+1 < len(path) and path[i+1]["type"] == "target":
-                    # Trouver l'indice de la prochaine feuille
-                    next_target_index = i + 1
-                    next_leaf_index = target_indices.index(next_target_index)
-                    
-                    if leaf_centroids is not None and next_leaf_index < len(leaf_centroids):
-                        print(f"\n--- Orientation vers la feuille au dernier point intermédiaire ---")
-                        
-                        # Obtenir la position actuelle
-                        final_pos = self.cnc.get_position()
-                        
-                        # Obtenir le centroïde de la prochaine feuille
-                        next_leaf_centroid = leaf_centroids[next_leaf_index]
-                        
-                        print(f"DEBUG: Orientation vers le centroïde: {next_leaf_centroid}")
-                        
-                        # Orienter la caméra vers le centroïde de la prochaine feuille
-                        success = self.gimbal.aim_at_target(final_pos, next_leaf_centroid, wait=True, invert_tilt=True)
-                        
-                        if not success:
-                            print("Erreur lors de l'orientation vers la feuille")
-                        else:
-                            print("Caméra orientée avec succès vers la feuille")
-                
                 # Si c'est un point cible et qu'on a des centroïdes de feuilles
                 if point_type == "target" and leaf_centroids is not None and current_leaf_index < len(leaf_centroids):
                     # Récupérer les informations de la feuille actuelle
@@ -120,7 +160,7 @@ class RobotController:
                     print(f"\n--- Orientation vers la feuille {leaf_id if leaf_id is not None else ''} ---")
                     
                     # Obtenir la position finale
-                    final_pos = self.cnc.get_position()
+                    final_pos = get_position()
                     
                     # Afficher des informations de débogage sur le centroïde original
                     print(f"DEBUG: Ajustement fin vers le centroïde: {leaf_centroid}")
@@ -128,67 +168,33 @@ class RobotController:
                     # Orienter la caméra vers la feuille avec inversion du tilt
                     # Nous utilisons le centroïde original sans modification,
                     # et nous inversons le tilt dans la méthode aim_at_target
-                    success = self.gimbal.aim_at_target(final_pos, leaf_centroid, wait=True, invert_tilt=True)
+                    success = aim_at_target(final_pos, leaf_centroid)
                     
                     if not success:
                         print("Erreur lors de l'orientation vers la feuille")
                         current_leaf_index += 1
                         continue
                     
-                    # Pause pour stabilisation
+                    # Pause pour stabilisation, après l'orientation de la gimbal
+                    # (le mouvement qui fait vibrer la caméra)
                     print(f"Stabilisation pendant {stabilization_time} secondes...")
                     time.sleep(stabilization_time)
                     
-                    # Prendre automatiquement une photo si demandé
-                    if auto_photo:
-                        timestamp = time.strftime("%Y%m%d-%H%M%S")
-                        if leaf_id is not None:
-                            filename = f"leaf_{leaf_id}_{timestamp}.jpg"
-                        else:
-                            filename = f"leaf_target_{current_leaf_index+1}_{timestamp}.jpg"
-                        
-                        # Créer un dictionnaire avec les informations de pose de la caméra
-                        camera_pose = {
-                            'x': final_pos['x'],
-                            'y': final_pos['y'],
-                            'z': final_pos['z'],
-                            'pan_angle': self.gimbal.current_pan,
-                            'tilt_angle': self.gimbal.current_tilt
-                        }
-                        
-                        photo_path, _ = self.camera.take_photo(filename, camera_pose)
-                        
-                        if photo_path:
-                            photos_taken.append((photo_path, leaf_id))
-                            print(f"Photo prise: {photo_path}")
-                    else:
-                        # Proposer de prendre une photo manuellement
-                        take_photo = input("\nPrendre une photo? (o/n): ").lower()
-                        if take_photo == 'o':
-                            timestamp = time.strftime("%Y%m%d-%H%M%S")
-                            if leaf_id is not None:
-                                filename = f"leaf_{leaf_id}_{timestamp}.jpg"
-                            else:
-                                filename = f"leaf_target_{current_leaf_index+1}_{timestamp}.jpg"
-                            
-                            # Créer un dictionnaire avec les informations de pose de la caméra
-                            camera_pose = {
-                                'x': final_pos['x'],
-                                'y': final_pos['y'],
-                                'z': final_pos['z'],
-                                'pan_angle': self.gimbal.current_pan,
-                                'tilt_angle': self.gimbal.current_tilt
-                            }
-                            
-                            photo_path, _ = self.camera.take_photo(filename, camera_pose)
-                            
-                            if photo_path:
-                                photos_taken.append((photo_path, leaf_id))
-                                print(f"Photo prise: {photo_path}")
+                    # Prendre la photo (automatiquement ou sur demande)
+                    photo_future = take_photo(final_pos, leaf_id, current_leaf_index)
+                    if photo_future is not None:
+                        pending_photos.append((photo_future, leaf_id))
                     
                     # Incrémenter l'index de la feuille
                     current_leaf_index += 1
             
+            # Attendre la fin des écritures de photos en arrière-plan
+            for photo_future, leaf_id in pending_photos:
+                photo_path, _ = photo_future.result()
+                if photo_path:
+                    photos_taken.append((photo_path, leaf_id))
+                    print(f"Photo prise: {photo_path}")
+            
             # Résumé des photos prises
             if photos_taken:
                 print("\n=== RÉSUMÉ DES PHOTOS PRISES ===")
@@ -199,22 +205,97 @@ class RobotController:
             
         except Exception as e:
             print(f"Erreur lors de l'exécution de la trajectoire: {e}")
-            import traceback
             traceback.print_exc()
             return False
     
+    def _take_auto_photo(self, final_pos, leaf_id, leaf_index):
+        """
+        Prend une photo de la feuille à la position courante
+        
+        Args:
+            final_pos: Position actuelle du CNC (dictionnaire x, y, z)
+            leaf_id: ID de la feuille (ou None)
+            leaf_index: Index de la feuille dans la trajectoire
+        
+        Returns:
+            Future de l'écriture de la photo, ou None si la capture a échoué
+        """
+        timestamp = datetime.now().strftime(PHOTO_TIMESTAMP_FORMAT)
+        if leaf_id is not None:
+            filename = f"leaf_{leaf_id}_{timestamp}.jpg"
+        else:
+            filename = f"leaf_target_{leaf_index+1}_{timestamp}.jpg"
+        
+        # Créer un dictionnaire avec les informations de pose de la caméra
+        camera_pose = {
+            'x': final_pos['x'],
+            'y': final_pos['y'],
+            'z': final_pos['z'],
+            'pan_angle': self.gimbal.current_pan,
+            'tilt_angle': self.gimbal.current_tilt
+        }
+        
+        return self.capture_photo_async(filename, camera_pose)
+    
+    def _take_prompted_photo(self, final_pos, leaf_id, leaf_index):
+        """Propose de prendre une photo manuellement (mêmes arguments que _take_auto_photo)"""
+        answer = input("\nPrendre une photo? (o/n): ").lower()
+        if answer != 'o':
+            return None
+        
+        return self._take_auto_photo(final_pos, leaf_id, leaf_index)
+    
+    def capture_photo_async(self, filename, camera_pose):
+        """
+        Capture une photo puis confie son écriture sur disque à un thread
+        
+        Args:
+            filename: Nom du fichier de la photo
+            camera_pose: Dictionnaire de la pose de la caméra
+        
+        Returns:
+            Future donnant (chemin, pose) une fois la photo écrite, ou None si
+            la capture a échoué
+        """
+        image = self.camera.capture()
+        if image is None:
+            return None
+        
+        # Bloque si la file est pleine (contre-pression du stockage)
+        photo_future = Future()
+        self._photo_queue.put((photo_future, image, filename, camera_pose))
+        return photo_future
+    
+    def _photo_writer_loop(self):
+        """Thread d'écriture: sauvegarde les images de la file jusqu'à recevoir None"""
+        while True:
+            item = self._photo_queue.get()
+            try:
+                if item is None:
+                    return
+                
+                photo_future, image, filename, camera_pose = item
+                try:
+                    photo_future.set_result(self.camera.save_image(image, filename, camera_pose))
+                except Exception as e:
+                    photo_future.set_exception(e)
+            finally:
+                self._photo_queue.task_done()
+    
     def normalize_angle_difference(self, delta):
         """Normalise la différence d'angle pour prendre le chemin le plus court"""
-        if delta > 180:
-            delta -= 360
-        elif delta < -180:
-            delta += 360
-        return delta
+        return normalize_angle_difference(delta)
     
     def shutdown(self):
         """Arrête proprement le robot"""
         print("Arrêt du robot...")
         
+        # Terminer les commandes de la gimbal et les écritures de photos en cours
+        self._gimbal_executor.shutdown(wait=True)
+        if self._photo_writer.is_alive():
+            self._photo_queue.put(None)
+            self._photo_writer.join()
+        
         # Réaliser les mêmes opérations que dans l'ancienne version
         if self.cnc is not None:
             try:
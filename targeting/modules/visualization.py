@@ -1,10 +1,149 @@
 # modules/visualization.py
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
 import os
+import logging
 
-def visualize_path(path, cloud_points=None, leaf_points=None, leaf_normal=None, output_dir=None):
+# Logger du module (configuré une seule fois par le script appelant)
+logger = logging.getLogger(__name__)
+
+# Générateur aléatoire du module (sous-échantillonnage pour l'affichage)
+_rng = np.random.default_rng()
+
+def sample_points(points, max_points, rng=_rng):
+    """
+    Sous-échantillonne des points pour l'affichage (utilisé par toutes les vues 3D)
+    
+    Tirage avec remise: quelques doublons parmi max_points sont invisibles à
+    l'affichage, et on évite la permutation complète de choice(replace=False).
+    """
+    if len(points) > max_points:
+        return points[rng.integers(0, len(points), size=max_points)]
+    return points
+
+def _make_3d_fig(figsize):
+    """
+    Crée une figure avec un unique axe 3D
+    
+    Args:
+        figsize: Taille de la figure (largeur, hauteur) en pouces
+    
+    Returns:
+        Tuple (fig, ax)
+    """
+    # Import différé: matplotlib n'est chargé que si une trajectoire est affichée
+    import matplotlib.pyplot as plt
+    
+    # constrained_layout: mise en page calculée au rendu (remplace tight_layout)
+    return plt.subplots(figsize=figsize, subplot_kw={'projection': '3d'}, constrained_layout=True)
+
+def _draw_cloud(ax, cloud_points, alpha, rng=_rng):
+    """
+    Affiche le nuage de points sous-échantillonné
+    
+    Args:
+        ax: Axes 3D matplotlib
+        cloud_points: Points du nuage (N, 3)
+        alpha: Transparence des points
+        rng: Générateur aléatoire utilisé pour l'échantillonnage
+    
+    Returns:
+        Artiste du nuage (entrée de légende)
+    """
+    # Échantillonner pour la performance
+    display_points = sample_points(cloud_points, 5000, rng)
+    
+    return ax.scatter(display_points[:, 0], display_points[:, 1], display_points[:, 2],
+                     c='black', s=1, alpha=alpha, label='Nuage de points', rasterized=True)
+
+def _draw_path(ax, path, path_array, point_types):
+    """
+    Affiche les points de la trajectoire (un seul scatter par type de point)
+    puis la trajectoire comme une ligne
+    
+    Args:
+        ax: Axes 3D matplotlib
+        path: Liste de dictionnaires décrivant la trajectoire
+        path_array: Positions de la trajectoire (M, 3)
+        point_types: Dictionnaire type -> (légende, couleur, marqueur, taille)
+    
+    Returns:
+        Tuple (positions des points cibles (T, 3) dans l'ordre de la trajectoire,
+        liste des artistes à placer dans la légende)
+    """
+    # Type de chaque point (type inconnu: style par défaut)
+    types = np.array([point_info["type"] if point_info["type"] in point_types else 'default'
+                      for point_info in path])
+    
+    handles = []
+    for point_type in (*point_types, 'default'):
+        bucket_array = path_array[types == point_type]
+        if len(bucket_array) == 0:
+            continue
+        
+        # Obtenir les informations de style pour ce type de point
+        if point_type in point_types:
+            label, color, marker, size = point_types[point_type]
+        else:
+            # Type par défaut si non reconnu
+            label, color, marker, size = ('Point', 'gray', 'o', 80)
+        
+        handles.append(ax.scatter(bucket_array[:, 0], bucket_array[:, 1], bucket_array[:, 2],
+                                  c=color, s=size, marker=marker, label=label))
+    
+    # Afficher la trajectoire comme une ligne (au moins un segment)
+    if len(path_array) > 1:
+        trajectory_line, = ax.plot(path_array[:, 0], path_array[:, 1], path_array[:, 2],
+                                   'k--', linewidth=2, label='Trajectoire')
+        handles.append(trajectory_line)
+    
+    return path_array[types == 'target'], handles
+
+def _configure_axes(ax, title):
+    """
+    Configure les axes, le titre et l'orientation de la vue
+    
+    Args:
+        ax: Axes 3D matplotlib
+        title: Titre de la figure
+    """
+    ax.set_xlabel('X (m)')
+    ax.set_ylabel('Y (m)')
+    ax.set_zlabel('Z (m)')
+    ax.set_title(title, fontsize=16)
+    
+    # Inverser les axes X et Y pour une orientation plus intuitive
+    # Cela place le point (0,0) plus près de nous
+    ax.invert_xaxis()
+    ax.invert_yaxis()
+    
+    # Ajuster la vue pour une meilleure orientation
+    ax.view_init(elev=20, azim=60)
+
+def _save_and_close(fig, output_dir, filename, description, dpi, show):
+    """
+    Sauvegarde la figure, l'affiche si demandé, puis la libère
+    
+    Args:
+        fig: Figure matplotlib
+        output_dir: Répertoire de sortie (None: répertoire courant)
+        filename: Nom du fichier image
+        description: Description utilisée dans le message de confirmation
+        dpi: Résolution de l'image sauvegardée
+        show: Afficher la figure après la sauvegarde
+    """
+    import matplotlib.pyplot as plt
+    
+    visualization_path = os.path.join(output_dir, filename) if output_dir else filename
+    fig.savefig(visualization_path, dpi=dpi)
+    logger.info("Visualisation %s sauvegardée dans '%s'", description, visualization_path)
+    
+    if show:
+        plt.show()
+    
+    # Libérer la figure (sinon pyplot la garde en mémoire)
+    plt.close(fig)
+
+def visualize_path(path, cloud_points=None, leaf_points=None, leaf_normal=None, output_dir=None, dpi=150, show=True):
     """
     Visualise la trajectoire planifiée
     
@@ -14,39 +153,34 @@ def visualize_path(path, cloud_points=None, leaf_points=None, leaf_normal=None,
         leaf_points: Points de la feuille (optionnel)
         leaf_normal: Normale de la feuille (optionnel)
         output_dir: Répertoire de sortie pour les visualisations
+        dpi: Résolution des images sauvegardées
+        show: Afficher la figure après la sauvegarde (bloquant: permet de vérifier
+            la trajectoire avant son exécution; False pour un traitement par lots)
     """
-    # Extraire les positions
-    positions = [np.array(point_info["position"]) for point_info in path]
+    # Trajectoire vide: rien à afficher, ne pas construire de figure
+    if not path:
+        logger.warning("Trajectoire vide: aucune visualisation générée")
+        return
+    
+    # Extraire les positions dans un seul tableau (M, 3)
+    path_array = np.array([point_info["position"] for point_info in path], dtype=float)
     
-    # Créer la figure
-    fig = plt.figure(figsize=(12, 10))
-    ax = fig.add_subplot(111, projection='3d')
+    fig, ax = _make_3d_fig((12, 10))
+    
+    # Artistes de la légende, collectés au fil de l'affichage
+    handles = []
     
     # Afficher le nuage si disponible
     if cloud_points is not None:
-        # Échantillonner pour la performance
-        max_display_points = 5000
-        if len(cloud_points) > max_display_points:
-            sample_indices = np.random.choice(len(cloud_points), max_display_points, replace=False)
-            display_points = cloud_points[sample_indices]
-        else:
-            display_points = cloud_points
-            
-        ax.scatter(display_points[:, 0], display_points[:, 1], display_points[:, 2],
-                  c='black', s=1, alpha=0.4, label='Nuage de points')
+        handles.append(_draw_cloud(ax, cloud_points, alpha=0.4))
     
     # Afficher la feuille si disponible
     if leaf_points is not None:
         # Échantillonner si nécessaire
-        max_leaf_points = 500
-        if len(leaf_points) > max_leaf_points:
-            sample_indices = np.random.choice(len(leaf_points), max_leaf_points, replace=False)
-            display_leaf_points = leaf_points[sample_indices]
-        else:
-            display_leaf_points = leaf_points
-            
-        ax.scatter(display_leaf_points[:, 0], display_leaf_points[:, 1], display_leaf_points[:, 2],
-                  c='green', s=15, label='Feuille')
+        display_leaf_points = sample_points(leaf_points, 500)
+        
+        handles.append(ax.scatter(display_leaf_points[:, 0], display_leaf_points[:, 1], display_leaf_points[:, 2],
+                                  c='green', s=15, label='Feuille', rasterized=True))
     
     # Afficher la normale si disponible
     if leaf_normal is not None and leaf_points is not None:
@@ -57,12 +191,12 @@ def visualize_path(path, cloud_points=None, leaf_points=None, leaf_normal=None,
         normal_length = 0.10  # 10 cm
         
         # Afficher la normale
-        ax.quiver(centroid[0], centroid[1], centroid[2],
-                 leaf_normal[0] * normal_length, 
-                 leaf_normal[1] * normal_length,
-                 leaf_normal[2] * normal_length,
-                 color='red', arrow_length_ratio=0.2, linewidth=2,
-                 label='Normale')
+        handles.append(ax.quiver(centroid[0], centroid[1], centroid[2],
+                                 leaf_normal[0] * normal_length, 
+                                 leaf_normal[1] * normal_length,
+                                 leaf_normal[2] * normal_length,
+                                 color='red', arrow_length_ratio=0.2, linewidth=2,
+                                 label='Normale'))
     
     # Afficher les points de la trajectoire avec une légende pour chaque type
     point_types = {'start': ('Départ', 'blue', 'o', 100),
@@ -70,64 +204,17 @@ def visualize_path(path, cloud_points=None, leaf_points=None, leaf_normal=None,
                   'target': ('Point cible', 'red', '*', 150),
                   'end': ('Position finale', 'purple', 'D', 150)}
     
-    # Garder une trace des types déjà ajoutés à la légende
-    legend_added = set()
+    _, path_handles = _draw_path(ax, path, path_array, point_types)
+    handles.extend(path_handles)
     
-    for i, (position, point_info) in enumerate(zip(positions, path)):
-        point_type = point_info["type"]
-        
-        # Obtenir les informations de style pour ce type de point
-        if point_type in point_types:
-            label, color, marker, size = point_types[point_type]
-        else:
-            # Type par défaut si non reconnu
-            label, color, marker, size = ('Point', 'gray', 'o', 80)
-        
-        # Ajouter à la légende seulement la première fois pour ce type
-        if point_type not in legend_added:
-            ax.scatter([position[0]], [position[1]], [position[2]],
-                      c=color, s=size, marker=marker, label=label)
-            legend_added.add(point_type)
-        else:
-            ax.scatter([position[0]], [position[1]], [position[2]],
-                      c=color, s=size, marker=marker)
-    
-    # Afficher la trajectoire comme une ligne
-    path_array = np.array(positions)
-    ax.plot(path_array[:, 0], path_array[:, 1], path_array[:, 2],
-           'k--', linewidth=2, label='Trajectoire')
+    _configure_axes(ax, 'Trajectoire planifiée')
     
-    # Configurer les axes
-    ax.set_xlabel('X (m)')
-    ax.set_ylabel('Y (m)')
-    ax.set_zlabel('Z (m)')
-    ax.set_title('Trajectoire planifiée', fontsize=16)
+    # Légende construite à partir des artistes collectés (pas de parcours des artistes de l'axe)
+    ax.legend(handles=handles, loc='best')
     
-    # CORRECTION : Inverser les axes X et Y pour une orientation plus intuitive
-    # Cela place le point (0,0) plus près de nous
-    ax.invert_xaxis()
-    ax.invert_yaxis()
-    
-    # CORRECTION : Ajuster la vue pour une meilleure orientation
-    ax.view_init(elev=20, azim=60)
-    
-    # Légende
-    ax.legend()
-    
-    # Sauvegarder et afficher
-    plt.tight_layout()
-    
-    if output_dir:
-        visualization_path = os.path.join(output_dir, 'planned_path.png')
-        plt.savefig(visualization_path, dpi=300)
-        print(f"Visualisation de la trajectoire sauvegardée dans '{visualization_path}'")
-    else:
-        plt.savefig('planned_path.png', dpi=300)
-        print("Visualisation de la trajectoire sauvegardée dans 'planned_path.png'")
-        
-    plt.show()
+    _save_and_close(fig, output_dir, 'planned_path.png', "de la trajectoire", dpi, show)
 
-def visualize_complete_path(path, cloud_points=None, leaves_points=None, leaves_normals=None, output_dir=None):
+def visualize_complete_path(path, cloud_points=None, leaves_points=None, leaves_normals=None, output_dir=None, dpi=150, show=True):
     """
     Visualise une trajectoire complète visitant plusieurs feuilles
     
@@ -137,68 +224,74 @@ def visualize_complete_path(path, cloud_points=None, leaves_points=None, leaves_
         leaves_points: Liste des points des feuilles (optionnel)
         leaves_normals: Liste des normales des feuilles (optionnel)
         output_dir: Répertoire de sortie pour les visualisations
+        dpi: Résolution des images sauvegardées
+        show: Afficher la figure après la sauvegarde (bloquant: permet de vérifier
+            la trajectoire avant son exécution; False pour un traitement par lots)
     """
-    # Extraire les positions
-    positions = [np.array(point_info["position"]) for point_info in path]
+    # Trajectoire vide: rien à afficher, ne pas construire de figure
+    if not path:
+        logger.warning("Trajectoire vide: aucune visualisation générée")
+        return
+    
+    # Import différé: matplotlib n'est chargé que si la trajectoire est affichée
+    import matplotlib.colors as mcolors
+    from matplotlib.lines import Line2D
+    import matplotlib.patheffects as patheffects
     
-    # Créer la figure
-    fig = plt.figure(figsize=(14, 12))
-    ax = fig.add_subplot(111, projection='3d')
+    # Extraire les positions dans un seul tableau (M, 3)
+    path_array = np.array([point_info["position"] for point_info in path], dtype=float)
+    
+    fig, ax = _make_3d_fig((14, 12))
+    
+    # Artistes de la légende, dans l'ordre: nuage, feuilles, trajectoire
+    handles = []
     
     # Afficher le nuage si disponible
     if cloud_points is not None:
-        # Échantillonner pour la performance
-        max_display_points = 5000
-        if len(cloud_points) > max_display_points:
-            sample_indices = np.random.choice(len(cloud_points), max_display_points, replace=False)
-            display_points = cloud_points[sample_indices]
-        else:
-            display_points = cloud_points
-            
-        ax.scatter(display_points[:, 0], display_points[:, 1], display_points[:, 2],
-                  c='black', s=1, alpha=0.3, label='Nuage de points')
+        handles.append(_draw_cloud(ax, cloud_points, alpha=0.3))
     
     # Afficher les feuilles si disponibles
     if leaves_points is not None:
         # Générer des couleurs distinctes pour les feuilles
+        # (teintes réparties uniformément, saturation 0.7, valeur 0.8, converties en une fois)
         n_leaves = len(leaves_points)
-        import colorsys
+        hsv = np.empty((n_leaves, 3))
+        hsv[:, 0] = np.arange(n_leaves) / max(n_leaves, 1)
+        hsv[:, 1] = 0.7
+        hsv[:, 2] = 0.8
+        colors = mcolors.hsv_to_rgb(hsv)
         
-        colors = []
-        for i in range(n_leaves):
-            hue = i / n_leaves
-            saturation = 0.7
-            value = 0.8
-            r, g, b = colorsys.hsv_to_rgb(hue, saturation, value)
-            colors.append([r, g, b])
+        # Regrouper les points échantillonnés de toutes les feuilles et leur couleur
+        display_leaves = [sample_points(leaf_points, 500) for leaf_points in leaves_points]
+        leaf_sizes = [len(display_leaf_points) for display_leaf_points in display_leaves]
         
-        for i, leaf_points in enumerate(leaves_points):
-            # Échantillonner si nécessaire
-            max_leaf_points = 500
-            if len(leaf_points) > max_leaf_points:
-                sample_indices = np.random.choice(len(leaf_points), max_leaf_points, replace=False)
-                display_leaf_points = leaf_points[sample_indices]
-            else:
-                display_leaf_points = leaf_points
-                
-            ax.scatter(display_leaf_points[:, 0], display_leaf_points[:, 1], display_leaf_points[:, 2],
-                      c=[colors[i]], s=15, label=f'Feuille {i+1}')
+        if n_leaves > 0:
+            leaf_array = np.concatenate(display_leaves)
+            leaf_colors = np.repeat(colors, leaf_sizes, axis=0)
+            
+            # Un seul scatter pour toutes les feuilles
+            ax.scatter(leaf_array[:, 0], leaf_array[:, 1], leaf_array[:, 2],
+                      c=leaf_colors, s=15, rasterized=True)
+        
+        # Une entrée de légende par feuille (marqueurs sans données)
+        handles.extend(
+            Line2D([], [], linestyle='', marker='o', color=colors[i], label=f'Feuille {i+1}')
+            for i in range(n_leaves)
+        )
+        
+        # Afficher les normales disponibles en un seul quiver
+        n_normals = min(n_leaves, len(leaves_normals)) if leaves_normals is not None else 0
+        if n_normals > 0:
+            # Centroïdes calculés sur tous les points de chaque feuille
+            centroids = np.array([np.mean(leaf_points, axis=0) for leaf_points in leaves_points[:n_normals]])
+            
+            # Longueur de la flèche
+            normal_length = 0.10  # 10 cm
+            normals = np.asarray(leaves_normals[:n_normals], dtype=float) * normal_length
             
-            # Afficher la normale si disponible
-            if leaves_normals is not None and i < len(leaves_normals):
-                leaf_normal = leaves_normals[i]
-                # Calculer le centroïde
-                centroid = np.mean(leaf_points, axis=0)
-                
-                # Longueur de la flèche
-                normal_length = 0.10  # 10 cm
-                
-                # Afficher la normale
-                ax.quiver(centroid[0], centroid[1], centroid[2],
-                         leaf_normal[0] * normal_length, 
-                         leaf_normal[1] * normal_length,
-                         leaf_normal[2] * normal_length,
-                         color='red', arrow_length_ratio=0.2, linewidth=2)
+            ax.quiver(centroids[:, 0], centroids[:, 1], centroids[:, 2],
+                     normals[:, 0], normals[:, 1], normals[:, 2],
+                     color='red', arrow_length_ratio=0.2, linewidth=2)
     
     # Afficher les points de la trajectoire avec une légende pour chaque type
     point_types = {'start': ('Départ', 'blue', 'o', 100),
@@ -206,69 +299,21 @@ def visualize_complete_path(path, cloud_points=None, leaves_points=None, leaves_
                   'target': ('Point cible', 'red', '*', 150),
                   'end': ('Position finale', 'purple', 'D', 150)}
     
-    # Garder une trace des types déjà ajoutés à la légende
-    legend_added = set()
-    
-    # Annoter les points cibles avec leur numéro d'ordre
-    target_count = 0
-    
-    for i, (position, point_info) in enumerate(zip(positions, path)):
-        point_type = point_info["type"]
-        
-        # Obtenir les informations de style pour ce type de point
-        if point_type in point_types:
-            label, color, marker, size = point_types[point_type]
-        else:
-            # Type par défaut si non reconnu
-            label, color, marker, size = ('Point', 'gray', 'o', 80)
-        
-        # Ajouter à la légende seulement la première fois pour ce type
-        if point_type not in legend_added:
-            ax.scatter([position[0]], [position[1]], [position[2]],
-                      c=color, s=size, marker=marker, label=label)
-            legend_added.add(point_type)
-        else:
-            ax.scatter([position[0]], [position[1]], [position[2]],
-                      c=color, s=size, marker=marker)
-        
-        # Ajouter un numéro pour les points cibles
-        if point_type == "target":
-            target_count += 1
-            ax.text(position[0], position[1], position[2] + 0.01,
-                   f"{target_count}", fontsize=12, color='black',
-                   horizontalalignment='center', verticalalignment='center',
-                   bbox=dict(facecolor='white', alpha=0.7, edgecolor='black'))
-    
-    # Afficher la trajectoire comme une ligne
-    path_array = np.array(positions)
-    ax.plot(path_array[:, 0], path_array[:, 1], path_array[:, 2],
-           'k--', linewidth=2, label='Trajectoire')
-    
-    # Configurer les axes
-    ax.set_xlabel('X (m)')
-    ax.set_ylabel('Y (m)')
-    ax.set_zlabel('Z (m)')
-    ax.set_title('Trajectoire complète planifiée', fontsize=16)
-    
-    # Inverser les axes X et Y pour une orientation plus intuitive
-    ax.invert_xaxis()
-    ax.invert_yaxis()
+    target_positions, path_handles = _draw_path(ax, path, path_array, point_types)
+    handles.extend(path_handles)
     
-    # Ajuster la vue pour une meilleure orientation
-    ax.view_init(elev=20, azim=60)
+    # Annoter les points cibles avec leur numéro d'ordre (contour blanc pour la
+    # lisibilité: moins coûteux au rendu qu'un cadre bbox par texte)
+    number_outline = [patheffects.withStroke(linewidth=3, foreground='white')]
+    for target_count, position in enumerate(target_positions, start=1):
+        ax.text(position[0], position[1], position[2] + 0.01,
+               f"{target_count}", fontsize=12, color='black',
+               horizontalalignment='center', verticalalignment='center',
+               path_effects=number_outline)
     
-    # Légende
-    ax.legend()
+    _configure_axes(ax, 'Trajectoire complète planifiée')
     
-    # Sauvegarder et afficher
-    plt.tight_layout()
+    # Légende construite à partir des artistes collectés (pas de parcours des artistes de l'axe)
+    ax.legend(handles=handles, loc='best')
     
-    if output_dir:
-        visualization_path = os.path.join(output_dir, 'complete_path.png')
-        plt.savefig(visualization_path, dpi=300)
-        print(f"Visualisation de la trajectoire complète sauvegardée dans '{visualization_path}'")
-    else:
-        plt.savefig('complete_path.png', dpi=300)
-        print("Visualisation de la trajectoire complète sauvegardée dans 'complete_path.png'")
-        
-    plt.show()
\ No newline at end of file
+    _save_and_close(fig, output_dir, 'complete_path.png', "de la trajectoire complète", dpi, show)